@@ -0,0 +1,116 @@
+import time
+from sortedcontainers import SortedList
+
+class BoardCache:
+    def __init__(self, ttl_seconds=30):
+        self.ttl_seconds = ttl_seconds
+        self.entries = {}       # board -> (expires_at, rendered)
+        self.generations = {}   # board -> bumped on every invalidation
+        self.columns = {}       # column -> boards that display it
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "stale_puts": 0}
+
+    def register(self, board, *columns):
+        """Declares which columns a board renders, so writes know what to drop."""
+        self.generations.setdefault(board, 0)
+        for col in columns:
+            self.columns.setdefault(col, set()).add(board)
+
+    def get(self, board):
+        entry = self.entries.get(board)
+        if entry and entry[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[1]
+        self.stats["misses"] += 1
+        return None
+
+    def generation(self, board):
+        return self.generations.get(board, 0)
+
+    def put(self, board, rendered, generation):
+        """Stores a render unless a write invalidated the board while it was being queried."""
+        if generation != self.generation(board):
+            self.stats["stale_puts"] += 1
+            return
+        self.entries[board] = (time.monotonic() + self.ttl_seconds, rendered)
+
+    def invalidate(self, *columns):
+        for col in columns:
+            for board in self.columns.get(col, ()):
+                self.generations[board] = self.generations.get(board, 0) + 1
+                if self.entries.pop(board, None) is not None:
+                    self.stats["invalidations"] += 1
+
+    def clear(self):
+        for board in list(self.generations):
+            self.generations[board] += 1
+        self.entries.clear()
+
+    def snapshot(self):
+        data = dict(self.stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 3) if lookups else 0.0
+        data["entries"] = len(self.entries)
+        data["ttl_seconds"] = self.ttl_seconds
+        return data
+
+class RankIndex:
+    def __init__(self, metrics):
+        self.metrics = tuple(metrics)
+        self.values = {m: {} for m in self.metrics}         # metric -> {user_id: value}
+        self.ordered = {m: SortedList() for m in self.metrics}
+        self.excluded = set()                               # users hidden from public boards
+        self.loaded = False
+
+    def load(self, rows, excluded=()):
+        """Rebuilds from (user_id, value per metric...) rows in O(n log n)."""
+        self.excluded = set(excluded)
+        for i, metric in enumerate(self.metrics):
+            values = {row[0]: float(row[i + 1] or 0) for row in rows if row[0] not in self.excluded}
+            self.values[metric] = values
+            self.ordered[metric] = SortedList(values.values())
+        self.loaded = True
+
+    def update(self, user_id, **changes):
+        if user_id == 0 or user_id in self.excluded:
+            return
+        for metric, value in changes.items():
+            if value is None:
+                continue
+            value = float(value)
+            old = self.values[metric].get(user_id)
+            if old == value:
+                continue
+            if old is not None:
+                self.ordered[metric].remove(old)
+            self.ordered[metric].add(value)
+            self.values[metric][user_id] = value
+
+    def reset(self, *metrics):
+        """Zeroes a metric for everyone, mirroring the daily reset."""
+        for metric in metrics:
+            values = self.values[metric]
+            for user_id in values:
+                values[user_id] = 0.0
+            self.ordered[metric] = SortedList([0.0] * len(values))
+
+    def rank(self, metric, user_id):
+        """Returns (rank, field_size) where rank 1 is the highest value, or None if unknown."""
+        value = self.values[metric].get(user_id)
+        if not self.loaded or value is None:
+            return None
+        ordered = self.ordered[metric]
+        return len(ordered) - ordered.bisect_right(value) + 1, len(ordered)
+
+    def top_percent(self, metric, user_id):
+        ranked = self.rank(metric, user_id)
+        if not ranked:
+            return None
+        rank, size = ranked
+        return max(1, -(-rank * 100 // size))
+
+    def snapshot(self):
+        return {
+            "loaded": self.loaded,
+            "users": {m: len(self.values[m]) for m in self.metrics},
+            "excluded": len(self.excluded)
+        }
@@ -1,14 +1,14 @@
 import os
 import logging
 import random
-import json
-import threading
+import io
+import hashlib
+import signal
 import asyncio
-from flask import Flask
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta, time, timezone
 from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
-from telegram.error import Forbidden, BadRequest
+from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, TypeHandler
+from telegram.error import BadRequest
 
 # --- SIDE CAR IMPORT ---
 try:
@@ -23,31 +23,146 @@ except ImportError:
 # ==========================================
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-flask_app = Flask(__name__)
-
-@flask_app.route("/")
-def home():
-    return "Planet Fatness: All Systems Online 🧪🥊", 200
-
-def run_flask():
-    port = int(os.environ.get("PORT", 10000))
-    flask_app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
-
-threading.Thread(target=run_flask, daemon=True).start()
 
 try:
     import psycopg2
 except ImportError:
     psycopg2 = None
 
+from database import DatabasePool, DatabaseExecutor, AsyncConnection
+from boards import BoardCache, RankIndex
+from kitchen import KitchenState
+from calories import CalorieBuffer, EventLedger
+from catalog import Catalog, CatalogWatcher, ContentSnapshot, Hack
+from media import FileIdCache
+from web import WebServer
+from dispatch import KeyedLocks, PerUserUpdateProcessor
+from cooldowns import CooldownGate
+from users import UserRecordCache, UsernameIndex
+from outbox import SendQueue, LANE_REPLY, LANE_NAG, LANE_BACKGROUND
+
 TOKEN = os.getenv("TELEGRAM_TOKEN")
+PORT = int(os.getenv("PORT", "10000"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # public base URL; unset = long polling
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256((TOKEN or "").encode()).hexdigest()[:32]
+STATS_TOKEN = os.getenv("STATS_TOKEN") or WEBHOOK_SECRET  # sent as X-Stats-Token to read /stats
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_HEALTHCHECK_SECONDS = int(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+BOARD_CACHE_TTL_SECONDS = int(os.getenv("BOARD_CACHE_TTL_SECONDS", "30"))
+CONTENT_WATCH_SECONDS = int(os.getenv("CONTENT_WATCH_SECONDS", "10"))
+GIF_PREWARM_CHAT_ID = int(os.getenv("GIF_PREWARM_CHAT_ID", "0"))  # 0 = no startup pre-warm
+KITCHEN_FLUSH_SECONDS = int(os.getenv("KITCHEN_FLUSH_SECONDS", "5"))  # max kitchen state lost on a crash
+CALORIE_FLUSH_MS = int(os.getenv("CALORIE_FLUSH_MS", "0"))  # 0 writes through; >0 batches deltas (and may lose that window on a crash)
+CALORIE_BUFFER_MAX_USERS = int(os.getenv("CALORIE_BUFFER_MAX_USERS", "500"))
+EVENT_FLUSH_SECONDS = int(os.getenv("EVENT_FLUSH_SECONDS", "2"))
+USER_RECORD_CACHE_SIZE = int(os.getenv("USER_RECORD_CACHE_SIZE", "10000"))
+USERNAME_REFRESH_SECONDS = int(os.getenv("USERNAME_REFRESH_SECONDS", "600"))  # picks up rows other processes create
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+SEND_GLOBAL_PER_SECOND = int(os.getenv("SEND_GLOBAL_PER_SECOND", "25"))  # Bot API allows ~30/s
+SEND_CHAT_PER_MINUTE = int(os.getenv("SEND_CHAT_PER_MINUTE", "20"))  # group chats allow ~20/min
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "5"))
 METER_GOAL = 20000
 MAIN_CHAT_ID = int(os.getenv("MAIN_CHAT_ID", "0"))
 RAMPAGE_SNACK_PENALTY = 2500
 RAMPAGE_HUNT_DAMAGE = 1500
 RAMPAGE_HUNT_COOLDOWN_MINUTES = 5
 RAMPAGE_REMINDER_MINUTES = 15
+DAILY_RESET_HOUR = 1  # UTC hour at which a new game day (epoch) starts
+RESET_CATCHUP_DAYS = 7  # winners older than this are pruned anyway
+KITCHEN_RETRY_SECONDS = 60
+SMACK_WINDOW = timedelta(minutes=15)
+
+# one pool for every handler and background task
+DB_POOL = DatabasePool(
+    DATABASE_URL,
+    minconn=DB_POOL_MIN,
+    maxconn=DB_POOL_MAX,
+    healthcheck_seconds=DB_POOL_HEALTHCHECK_SECONDS,
+    sslmode="require"
+)
+# blocking psycopg2 calls run here so handlers never stall the event loop
+DB_EXECUTOR = DatabaseExecutor(DB_POOL, max_workers=DB_POOL_MAX)
+
+# rendered board text, dropped whenever a write touches a column the board shows
+BOARD_CACHE = BoardCache(ttl_seconds=BOARD_CACHE_TTL_SECONDS)
+BOARD_CACHE.register("leaderboard", "total_calories")
+BOARD_CACHE.register("daily", "daily_calories")
+BOARD_CACHE.register("clogboard", "daily_clog")
+BOARD_CACHE.register("deaths", "icu_lifetime")
+BOARD_CACHE.register("halloffame", "lifetime_daily_wins", "lifetime_hack_wins")
+BOARD_CACHE.register("winners", "airdrop_winners")
+BOARD_CACHE.register("weekly", "events")
+
+# per-metric order statistics for "#rank of N" lookups in /status
+RANKS = RankIndex(("total_calories", "daily_calories", "daily_clog", "icu_lifetime"))
+
+# the kitchen is owned by this process; pf_kitchen is its write-behind copy
+KITCHEN = KitchenState()
+
+# calorie/heat deltas awaiting a bulk flush (only when CALORIE_FLUSH_MS > 0)
+CALORIE_BUFFER = CalorieBuffer(flush_ms=CALORIE_FLUSH_MS, max_users=CALORIE_BUFFER_MAX_USERS)
+
+# pf_events.kind codes; append new kinds, never renumber
+EVENT_KINDS = {
+    "snack": 1,
+    "rampage_hit": 2,
+    "smack_cost": 3,
+    "smack_back": 4,
+    "counter_slap": 5,
+    "knockout": 6,
+    "chef_hunt": 7,
+    "gift_open": 8,
+    "gift_reflect": 9,
+    "gift_jackpot": 10,
+    "trash": 11,
+    "reward": 12
+}
+# calorie history, COPY'd into pf_events in batches
+EVENTS = EventLedger(EVENT_KINDS)
+
+# gif URL -> Telegram file_id, mirrored in pf_media_cache
+GIF_CACHE = FileIdCache()
+
+# every outbound message goes through here, never straight to the Bot API
+SEND_QUEUE = SendQueue(
+    global_per_second=SEND_GLOBAL_PER_SECOND,
+    chat_per_minute=SEND_CHAT_PER_MINUTE,
+    chat_burst=SEND_CHAT_BURST
+)
+
+# health, readiness, /stats and (in webhook mode) update ingestion, all on the bot's loop
+WEB = WebServer(
+    port=PORT,
+    banner="Planet Fatness: All Systems Online 🧪🥊",
+    stats=lambda: runtime_stats(),
+    ready=lambda: ACCEPTING_UPDATES and KITCHEN.loaded,
+    webhook_path=WEBHOOK_PATH if WEBHOOK_URL else None,
+    webhook_secret=WEBHOOK_SECRET,
+    stats_token=STATS_TOKEN
+)
+ACCEPTING_UPDATES = False
+
+# updates run concurrently across users, one at a time per user
+UPDATE_PROCESSOR = PerUserUpdateProcessor(max_concurrent_updates=MAX_CONCURRENT_UPDATES)
+# cross-user sections: smacks on one target, deliveries to one dock.
+# Both are taken while the caller already holds its own user lock, and
+# nothing holding them ever waits on a user lock, so they cannot deadlock.
+SMACK_TARGET_LOCKS = KeyedLocks()
+DOCK_LOCKS = KeyedLocks()
+# kitchen ticks (hunts) run one at a time; KitchenState itself only changes in sync code
+KITCHEN_LOCK = asyncio.Lock()
+
+# running /snack, /hack, /gift and /phatme cooldowns, so early retries skip Postgres
+COOLDOWNS = CooldownGate()
+
+# users whose row is known to be current, so ensure_user_record can skip its upsert
+USER_RECORDS = UserRecordCache(max_users=USER_RECORD_CACHE_SIZE)
+
+# @name -> user_id for /smack and /gift targets, so lookups never scan pf_users
+USERNAMES = UsernameIndex()
 
 # passive hunt cooldown memory
 LAST_CHEF_HUNT_AT = None
@@ -58,16 +173,22 @@ REMOVED_LEADERBOARD_USERS = ("pop_polo", "dooragricky")
 # ==========================================
 # 2. DATA LOADING & HELPERS
 # ==========================================
-foods, hacks, punishments = [], [], []
+# draw weights per food tier/category; anything not listed weighs 1 (all 1 = plain uniform)
+FOOD_TIER_WEIGHTS = {}
+FOOD_CATEGORY_WEIGHTS = {}
+
+def build_content():
+    """Compiles the catalog and its alias samplers (O(1) draws); safe to run off the event loop."""
+    return ContentSnapshot(Catalog.load(), FOOD_TIER_WEIGHTS, FOOD_CATEGORY_WEIGHTS)
+
 try:
-    with open("foods.json", "r") as f:
-        foods = json.load(f)
-    with open("hacks.json", "r") as f:
-        hacks = json.load(f)
-    with open("gift_punishments.json", "r") as f:
-        punishments = json.load(f)
+    CONTENT = build_content()
 except Exception as e:
     logger.error(f"❌ JSON Load Failed: {e}")
+    CONTENT = ContentSnapshot(Catalog((), (), ()))
+
+# swaps CONTENT when foods/hacks/punishments change on disk
+CONTENT_WATCHER = CatalogWatcher(build_content)
 
 CHARLIE_QUOTES = [
     # Phil Roast Mode
@@ -156,7 +277,31 @@ CHARLIE_QUOTES = [
 ]
 
 def get_db_connection():
-    return psycopg2.connect(DATABASE_URL, sslmode="require")
+    return DB_POOL.getconn()
+
+async def db_connect():
+    return await DB_EXECUTOR.connect()
+
+def runtime_stats():
+    return {
+        "db_pool": DB_POOL.snapshot(),
+        "db_executor": DB_EXECUTOR.snapshot(),
+        "board_cache": BOARD_CACHE.snapshot(),
+        "ranks": RANKS.snapshot(),
+        "kitchen": KITCHEN.snapshot(),
+        "calorie_buffer": CALORIE_BUFFER.snapshot(),
+        "events": EVENTS.snapshot(),
+        "catalog": dict(CONTENT.catalog.snapshot(), **CONTENT_WATCHER.snapshot()),
+        "gif_cache": GIF_CACHE.snapshot(),
+        "send_queue": SEND_QUEUE.snapshot(),
+        "web": WEB.snapshot(),
+        "dispatch": UPDATE_PROCESSOR.snapshot(),
+        "smack_target_locks": SMACK_TARGET_LOCKS.snapshot(),
+        "dock_locks": DOCK_LOCKS.snapshot(),
+        "cooldowns": COOLDOWNS.snapshot(),
+        "user_records": USER_RECORDS.snapshot(),
+        "usernames": USERNAMES.snapshot()
+    }
 
 def escape_name(name):
     if not name:
@@ -182,6 +327,10 @@ def get_icu_rank(visits):
         return "Cardiac Immortal"
     return "Ghost of Planet Fatness"
 
+def format_rank(metric, user_id):
+    ranked = RANKS.rank(metric, user_id)
+    return f" (#{ranked[0]:,})" if ranked else ""
+
 def get_win_title(wins, is_hacker=False):
     if wins == 0:
         return None
@@ -201,41 +350,16 @@ def get_win_title(wins, is_hacker=False):
 def random_charlie_quote():
     return random.choice(CHARLIE_QUOTES)
 
-def roll_punishment():
-    if not punishments:
+def roll_punishment(content=None):
+    content = content or CONTENT
+    if not content.punishments:
         return None
 
-    total_weight = sum(int(p.get("weight", 1)) for p in punishments)
-    if total_weight <= 0:
-        return None
-
-    r = random.uniform(0, total_weight)
-    upto = 0
-
-    for p in punishments:
-        w = int(p.get("weight", 1))
-        if upto + w >= r:
-            low = int(p.get("min", -1000))
-            high = int(p.get("max", -500))
-            if low > high:
-                low, high = high, low
-            value = random.randint(low, high)
-            return {
-                "name": p.get("name", "Cursed Delivery"),
-                "value": value,
-                "text": p.get("text", "Something went horribly wrong.")
-            }
-        upto += w
-
-    p = punishments[-1]
-    low = int(p.get("min", -1000))
-    high = int(p.get("max", -500))
-    if low > high:
-        low, high = high, low
+    p = content.punishments.draw()
     return {
-        "name": p.get("name", "Cursed Delivery"),
-        "value": random.randint(low, high),
-        "text": p.get("text", "Something went horribly wrong.")
+        "name": p.name,
+        "value": random.randint(p.low, p.high),
+        "text": p.text
     }
 
 def is_founder(user):
@@ -248,25 +372,245 @@ def safe_close(cur=None, conn=None):
     except Exception:
         pass
     try:
-        if conn:
-            conn.close()
+        if isinstance(conn, AsyncConnection):
+            DB_EXECUTOR.release(conn)
+        elif conn:
+            DB_POOL.putconn(conn)
     except Exception:
         pass
 
-def ensure_user_record(cur, user):
-    username = user.username or user.first_name or f"user_{user.id}"
-    cur.execute("""
+def track_calorie_change(user_id, totals):
+    """Pushes a committed (total_calories, daily_calories) row into the board cache and rank index."""
+    BOARD_CACHE.invalidate("total_calories", "daily_calories")
+    if totals:
+        RANKS.update(user_id, total_calories=totals[0], daily_calories=totals[1])
+
+async def apply_calorie_delta(cur, user_id, calories, heat=0, kind=None, now=None):
+    """Adds calories (and heat) to a user, floored at zero.
+
+    With a kind, the change that actually reached daily_calories is recorded
+    in the ledger once it commits. Returns the new (total_calories,
+    daily_calories) row, or None when the delta was buffered for the next bulk flush."""
+    now = now or datetime.utcnow()
+    if CALORIE_BUFFER.enabled:
+        if CALORIE_BUFFER.add(user_id, calories, heat, day_epoch(now), kind and (kind, now)):
+            asyncio.get_running_loop().create_task(flush_calories())
+        return None
+    await cur.execute("""
+        WITH old AS (SELECT daily_calories FROM pf_user_counters WHERE user_id = %s FOR UPDATE)
+        UPDATE pf_user_counters u
+        SET daily_calories = GREATEST(0, u.daily_calories + %s),
+            total_calories = GREATEST(0, u.total_calories + %s),
+            heat_level = GREATEST(0, u.heat_level + %s)
+        FROM old
+        WHERE u.user_id = %s
+        RETURNING u.total_calories, u.daily_calories, u.daily_calories - old.daily_calories
+    """, (user_id, calories, calories, heat, user_id))
+    row = cur.fetchone()
+    if not row:
+        return None
+    if kind:
+        cur.connection.after_commit(lambda: record_event(user_id, kind, row[2], now))
+    return row[:2]
+
+async def flush_calories():
+    """Applies every buffered delta in one transaction, each to the game day it was earned on."""
+    batch = CALORIE_BUFFER.drain()
+    if not batch:
+        return
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute(
+            "SELECT 1 FROM pf_user_counters WHERE user_id = ANY(%s) ORDER BY user_id FOR UPDATE",
+            (sorted({u for group in batch for u in group[1]}),)
+        )
+        rows = []
+        for epoch, user_ids, calories, heats, events in batch:
+            # rows from an older game day roll over first, exactly as a direct write would;
+            # rows already past `epoch` credit its closed total instead of today's
+            await cur.execute("""
+                SELECT pf_roll_day(v.user_id, %s) FROM unnest(%s::BIGINT[]) AS v(user_id);
+                WITH v AS (
+                    SELECT * FROM unnest(%s::BIGINT[], %s::BIGINT[], %s::INTEGER[]) AS v(user_id, calories, heat)
+                ),
+                old AS (
+                    SELECT p.user_id, p.day_epoch, p.prev_epoch, p.daily_calories, p.prev_daily_calories
+                    FROM pf_user_counters p JOIN v USING (user_id)
+                )
+                UPDATE pf_user_counters u
+                SET daily_calories = CASE WHEN u.day_epoch = %s
+                        THEN GREATEST(0, u.daily_calories + v.calories) ELSE u.daily_calories END,
+                    prev_daily_calories = CASE WHEN u.day_epoch > %s AND u.prev_epoch = %s
+                        THEN GREATEST(0, u.prev_daily_calories + v.calories) ELSE u.prev_daily_calories END,
+                    total_calories = GREATEST(0, u.total_calories + v.calories),
+                    heat_level = CASE WHEN u.day_epoch = %s
+                        THEN GREATEST(0, u.heat_level + v.heat) ELSE u.heat_level END
+                FROM v JOIN old USING (user_id)
+                WHERE u.user_id = v.user_id
+                RETURNING u.user_id, u.total_calories, u.daily_calories,
+                    CASE WHEN old.day_epoch = %s THEN u.daily_calories - old.daily_calories
+                         WHEN old.day_epoch > %s AND old.prev_epoch = %s
+                         THEN u.prev_daily_calories - old.prev_daily_calories END
+            """, (epoch, user_ids, user_ids, calories, heats, epoch, epoch, epoch, epoch, epoch, epoch, epoch))
+            queued = dict(zip(user_ids, events))
+            rows.extend((user_id, total, daily, applied, queued[user_id])
+                        for user_id, total, daily, applied in cur.fetchall())
+        await conn.commit()
+        CALORIE_BUFFER.mark_flushed(batch)
+        for user_id, total, daily, applied, evs in rows:
+            track_calorie_change(user_id, (total, daily))
+            if applied is not None:
+                for kind, delta, created_at in CalorieBuffer.settle(evs, applied):
+                    record_event(user_id, kind, delta, created_at)
+    except Exception as e:
+        CALORIE_BUFFER.stats["flush_errors"] += 1
+        CALORIE_BUFFER.requeue(batch)
+        if conn:
+            await conn.rollback()
+        logger.error(f"Calorie Flush Error: {e}")
+    finally:
+        safe_close(cur, conn)
+
+def record_event(user_id, kind, delta, now=None):
+    """Queues a committed calorie change for the ledger.
+
+    delta is what actually reached daily_calories after flooring, so a day's
+    events add up to that day's total."""
+    if EVENTS.record(user_id, kind, delta, now or datetime.utcnow()):
+        asyncio.get_running_loop().create_task(flush_events())
+
+async def flush_events():
+    """COPYs buffered events into pf_events and folds them into pf_event_days in one transaction."""
+    batch = EVENTS.drain()
+    if not batch:
+        return
+    days, user_ids, kinds, deltas, counts = EventLedger.rollup(batch, day_epoch)
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.copy_expert(
+            "COPY pf_events (user_id, kind, delta, created_at) FROM STDIN",
+            io.StringIO(EventLedger.copy_rows(batch))
+        )
+        await cur.execute("""
+            INSERT INTO pf_event_days (day_epoch, user_id, kind, delta, events)
+            SELECT * FROM unnest(%s::INTEGER[], %s::BIGINT[], %s::SMALLINT[], %s::BIGINT[], %s::INTEGER[])
+            ON CONFLICT (day_epoch, user_id, kind) DO UPDATE SET
+                delta = pf_event_days.delta + EXCLUDED.delta,
+                events = pf_event_days.events + EXCLUDED.events
+        """, (days, user_ids, kinds, deltas, counts))
+        await conn.commit()
+        EVENTS.mark_flushed(batch)
+        BOARD_CACHE.invalidate("events")
+    except Exception as e:
+        EVENTS.stats["flush_errors"] += 1
+        EVENTS.requeue(batch)
+        if conn:
+            await conn.rollback()
+        logger.error(f"Event Flush Error: {e}")
+    finally:
+        safe_close(cur, conn)
+
+def day_epoch(now=None):
+    """Game-day number; daily stats belong to the epoch stamped on their row."""
+    now = now or datetime.utcnow()
+    return int((now - datetime(1970, 1, 1) - timedelta(hours=DAILY_RESET_HOUR)).total_seconds() // 86400)
+
+def hold_daily_cooldown(action, user_id, now, wait, detail=None):
+    """Holds a snack/hack cooldown, which the day rollover wipes, until whichever comes first."""
+    ready_at = min(now + wait, epoch_start(day_epoch(now) + 1))
+    COOLDOWNS.hold(action, user_id, ready_at, detail)
+
+def user_record_name(user):
+    return user.username or user.first_name or f"user_{user.id}"
+
+def remember_user_record(cur, user_id, username, epoch):
+    # only a committed row may be skipped next time
+    cur.connection.after_commit(lambda: USER_RECORDS.remember(user_id, username, epoch))
+
+async def ensure_user_record(cur, user):
+    """Creates/renames the user's row and rolls it into today, unless it is known to be current."""
+    username = user_record_name(user)
+    epoch = day_epoch()
+    if USER_RECORDS.fresh(user.id, username, epoch):
+        return
+    await cur.execute("""
+        SELECT pf_roll_day(%s, %s);
         INSERT INTO pf_users (user_id, username)
         VALUES (%s, %s)
         ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
-    """, (user.id, username))
+        WHERE pf_users.username IS DISTINCT FROM EXCLUDED.username;
+        INSERT INTO pf_user_counters (user_id, day_epoch)
+        VALUES (%s, %s)
+        ON CONFLICT (user_id) DO NOTHING
+    """, (user.id, epoch, user.id, username, user.id, epoch))
+    remember_user_record(cur, user.id, username, epoch)
 
-def ensure_user_id_record(cur, user_id, username="Unknown"):
-    cur.execute("""
+async def ensure_user_id_record(cur, user_id, username="Unknown"):
+    epoch = day_epoch()
+    if USER_RECORDS.fresh(user_id, None, epoch):
+        return
+    await cur.execute("""
+        SELECT pf_roll_day(%s, %s);
         INSERT INTO pf_users (user_id, username)
         VALUES (%s, %s)
+        ON CONFLICT (user_id) DO NOTHING;
+        INSERT INTO pf_user_counters (user_id, day_epoch)
+        VALUES (%s, %s)
         ON CONFLICT (user_id) DO NOTHING
-    """, (user_id, username))
+    """, (user_id, epoch, user_id, username, user_id, epoch))
+    # the stored name may differ from the placeholder, so it stays unknown
+    remember_user_record(cur, user_id, None, epoch)
+
+async def find_user_by_name(name):
+    """Resolves an @name to (user_id, stored username), or None; Postgres is only asked before the index loads."""
+    found = USERNAMES.resolve(name)
+    now = asyncio.get_running_loop().time()
+    if found or not USERNAMES.needs_lookup(name, now):
+        return found
+
+    name = name.strip().lstrip("@")
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("""
+            SELECT user_id, username
+            FROM pf_users
+            WHERE LOWER(username) = LOWER(%s) OR LOWER(username) = LOWER(%s)
+            LIMIT 1
+        """, (name, f"@{name}"))
+        row = cur.fetchone()
+    finally:
+        safe_close(cur, conn)
+
+    if not row:
+        USERNAMES.mark_missing(name, now)
+        return None
+    USERNAMES.observe(row[0], row[1])
+    return row[0], row[1]
+
+async def observe_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Feeds every human sender (and the one they reply to) into the username index."""
+    message = update.effective_message
+    replied = message.reply_to_message.from_user if message and message.reply_to_message else None
+    for user in (update.effective_user, replied):
+        if user and not user.is_bot:
+            USERNAMES.observe(user.id, user_record_name(user))
+
+async def stamp_cooldown(cur, column, user_id, now):
+    """Sets a pf_user_cooldowns column; the narrow row keeps the write HOT."""
+    await cur.execute(f"""
+        INSERT INTO pf_user_cooldowns (user_id, {column})
+        VALUES (%s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET {column} = EXCLUDED.{column}
+    """, (user_id, now))
 
 def rampage_active_until(rampage_until, now=None):
     now = now or datetime.utcnow()
@@ -299,30 +643,100 @@ def get_rage_tier(rage):
         return 25
     return 0
 
-async def send_main_chat_message(bot, text):
-    if not MAIN_CHAT_ID:
+async def store_file_id(url, file_id):
+    if not GIF_CACHE.put(url, file_id):
         return
+    conn = None
+    cur = None
     try:
-        await bot.send_message(
-            chat_id=MAIN_CHAT_ID,
-            text=text,
-            parse_mode='Markdown'
-        )
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("""
+            INSERT INTO pf_media_cache (url, file_id, updated_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (url) DO UPDATE SET file_id = EXCLUDED.file_id, updated_at = NOW()
+        """, (url, file_id))
+        await conn.commit()
     except Exception as e:
-        logger.warning(f"Main chat send failed: {e}")
+        logger.warning(f"File ID Store Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-async def maybe_announce_rage(bot, cur, conn, rage):
-    tier = get_rage_tier(rage)
+# BadRequest texts meaning the cached file_id itself is no longer usable
+STALE_FILE_ID_ERRORS = ("wrong file identifier", "file reference")
 
-    cur.execute("""
-        SELECT last_rage_announce_level
-        FROM pf_users
-        WHERE user_id = 0
-    """)
-    row = cur.fetchone()
-    last_tier = row[0] if row and row[0] is not None else 0
+def is_stale_file_id_error(error):
+    text = str(error).lower()
+    return any(marker in text for marker in STALE_FILE_ID_ERRORS)
+
+async def drop_file_id(url):
+    if not GIF_CACHE.invalidate(url):
+        return
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("DELETE FROM pf_media_cache WHERE url = %s", (url,))
+        await conn.commit()
+    except Exception as e:
+        logger.warning(f"File ID Drop Error: {e}")
+    finally:
+        safe_close(cur, conn)
+
+def reply(message, text, lane=LANE_REPLY, **kwargs):
+    """Queues message.reply_text; returns a future for the sent Message (None if it failed)."""
+    return SEND_QUEUE.submit(message.chat_id, lambda: message.reply_text(text, **kwargs), lane)
+
+def nag(message, text, **kwargs):
+    """A cooldown/refusal reply: sent after everything else and dropped if it goes stale."""
+    return reply(message, text, lane=LANE_NAG, **kwargs)
 
-    if tier <= last_tier or tier == 0:
+async def reply_snack_animation(message, gif_url, caption):
+    """Sends a gif by cached file_id, falling back to (and learning from) the URL, then to plain text."""
+    file_id = GIF_CACHE.get(gif_url)
+    if file_id:
+        try:
+            return await SEND_QUEUE.submit(
+                message.chat_id,
+                lambda: message.reply_animation(animation=file_id, caption=caption, parse_mode='Markdown'),
+                raise_errors=True
+            )
+        except BadRequest as e:
+            if not is_stale_file_id_error(e):
+                logger.warning(f"Animation send failed for {gif_url}: {e}")
+                return await reply(message, caption, parse_mode='Markdown')
+            logger.warning(f"Stale file_id for {gif_url}: {e}")
+            await drop_file_id(gif_url)
+        except Exception as e:
+            logger.warning(f"Animation send failed for {gif_url}: {e}")
+            return await reply(message, caption, parse_mode='Markdown')
+
+    sent = await SEND_QUEUE.submit(
+        message.chat_id,
+        lambda: message.reply_animation(animation=gif_url, caption=caption, parse_mode='Markdown')
+    )
+    if sent and sent.animation:
+        await store_file_id(gif_url, sent.animation.file_id)
+    if sent is None:
+        logger.warning(f"Animation send by URL failed for {gif_url}; replying with text")
+        return await reply(message, caption, parse_mode='Markdown')
+    return sent
+
+def send_main_chat_message(bot, text, merge_key=None):
+    """Queues an announcement for the main chat; queued announcements are merged into one message."""
+    if not MAIN_CHAT_ID:
+        return None
+    return SEND_QUEUE.announce(
+        MAIN_CHAT_ID,
+        lambda merged: bot.send_message(chat_id=MAIN_CHAT_ID, text=merged, parse_mode='Markdown'),
+        text,
+        merge_key
+    )
+
+async def maybe_announce_rage(bot, rage):
+    tier = get_rage_tier(rage)
+    if not KITCHEN.claim_rage_tier(tier):
         return
 
     if tier == 25:
@@ -353,77 +767,624 @@ async def maybe_announce_rage(bot, cur, conn, rage):
             f"The kitchen has lost control."
         )
 
-    await send_main_chat_message(bot, msg)
+    # a higher tier replaces a lower one that hasn't gone out yet
+    send_main_chat_message(bot, msg, merge_key="rage_tier")
 
-    cur.execute("""
-        UPDATE pf_users
-        SET last_rage_announce_level = %s
-        WHERE user_id = 0
-    """, (tier,))
-    conn.commit()
-
-async def maybe_send_rampage_reminder(bot, cur, conn, rampage_until, now):
+async def maybe_send_rampage_reminder(bot, rampage_until, now):
     if not rampage_active_until(rampage_until, now):
         return
 
-    cur.execute("""
-        SELECT last_rampage_reminder_at
-        FROM pf_users
-        WHERE user_id = 0
-    """)
-    row = cur.fetchone()
-    last_reminder = row[0] if row else None
-
-    if last_reminder and (now - last_reminder) < timedelta(minutes=RAMPAGE_REMINDER_MINUTES):
-        return
+    send_now, next_due = KITCHEN.claim_reminder(now, timedelta(minutes=RAMPAGE_REMINDER_MINUTES))
+    if not send_now:
+        return next_due
 
     mins_left = max(1, int((rampage_until - now).total_seconds() // 60))
-    await send_main_chat_message(
+    send_main_chat_message(
         bot,
         f"🔥 **CHEF RAMPAGE IS STILL LIVE**\n"
         f"⏳ **Time left:** {mins_left}m\n"
         f"⚠️ Snack risk is active (**50/50** for **-{RAMPAGE_SNACK_PENALTY:,} Cal**)\n"
-        f"⚠️ Anyone with heat can be hunted."
+        f"⚠️ Anyone with heat can be hunted.",
+        merge_key="rampage_reminder"
+    )
+    return next_due
+
+async def maybe_send_rampage_end(bot, old_until, now):
+    if not KITCHEN.claim_rampage_end(old_until, now):
+        return
+
+    send_main_chat_message(
+        bot,
+        "🧊 **CHEF HAS COOLED OFF**\nThe kitchen is no longer in rampage mode.\nFor now."
+    )
+
+# ==========================================
+# 3. DATABASE INITIALIZATION & MIGRATIONS
+# ==========================================
+# Daily stats are stamped with the game day they belong to. A row from an
+# older day is rolled over the next time it is touched (its closing totals
+# move to prev_*), so the daily reset never rewrites the whole table.
+DAY_FUNCTIONS_SQL = """
+    CREATE OR REPLACE FUNCTION pf_day_epoch(p_ts TIMESTAMP)
+    RETURNS INTEGER
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT FLOOR(EXTRACT(EPOCH FROM p_ts - INTERVAL '1 hour') / 86400)::INTEGER
+    $$;
+
+    CREATE OR REPLACE FUNCTION pf_roll_day(p_user_id BIGINT, p_epoch INTEGER)
+    RETURNS VOID
+    LANGUAGE sql AS $$
+        UPDATE pf_user_counters
+        SET prev_epoch = day_epoch,
+            prev_daily_calories = daily_calories,
+            prev_daily_clog = daily_clog,
+            daily_calories = 0,
+            daily_clog = 0,
+            is_icu = FALSE,
+            daily_ko_count = 0,
+            heat_level = 0,
+            last_snack = NULL,
+            last_hack = NULL,
+            day_epoch = p_epoch
+        WHERE user_id = p_user_id
+          AND user_id <> 0
+          AND day_epoch < p_epoch
+    $$;
+"""
+
+# /snack and /hack resolve inside Postgres: the caller rolls the dice and
+# the function applies cooldowns, rampage risk and totals in one statement.
+# The kitchen lives in process, so p_rampage_hit arrives already resolved.
+SNACK_FUNCTION_SQL = """
+    DROP FUNCTION IF EXISTS pf_snack(BIGINT, TEXT, TIMESTAMP, INTEGER, INTEGER, BOOLEAN, BOOLEAN, BOOLEAN);
+    DROP FUNCTION IF EXISTS pf_snack(BIGINT, TEXT, TIMESTAMP, INTEGER, INTEGER, BOOLEAN, BOOLEAN);
+    CREATE FUNCTION pf_snack(
+        p_user_id BIGINT,
+        p_username TEXT,
+        p_now TIMESTAMP,
+        p_calories INTEGER,
+        p_penalty INTEGER,
+        p_rampage_hit BOOLEAN,
+        p_confiscate BOOLEAN
+    )
+    RETURNS TABLE (
+        outcome TEXT,
+        wait_seconds INTEGER,
+        daily_total INTEGER,
+        grand_total BIGINT,
+        daily_delta INTEGER
+    )
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        v_daily INTEGER;
+        v_before INTEGER;
+        v_total BIGINT;
+        v_last TIMESTAMP;
+        v_heat INTEGER;
+    BEGIN
+        PERFORM pf_roll_day(p_user_id, pf_day_epoch(p_now));
+
+        INSERT INTO pf_users (user_id, username)
+        VALUES (p_user_id, p_username)
+        ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+        WHERE pf_users.username IS DISTINCT FROM EXCLUDED.username;
+
+        INSERT INTO pf_user_counters (user_id, day_epoch)
+        VALUES (p_user_id, pf_day_epoch(p_now))
+        ON CONFLICT (user_id) DO NOTHING;
+
+        SELECT daily_calories, total_calories, last_snack, heat_level
+        INTO v_daily, v_total, v_last, v_heat
+        FROM pf_user_counters WHERE user_id = p_user_id
+        FOR UPDATE;
+
+        IF v_last IS NOT NULL AND p_now - v_last < INTERVAL '1 hour' THEN
+            RETURN QUERY SELECT 'COOLDOWN'::TEXT,
+                FLOOR(EXTRACT(EPOCH FROM INTERVAL '1 hour' - (p_now - v_last)))::INTEGER,
+                COALESCE(v_daily, 0), COALESCE(v_total, 0), 0;
+            RETURN;
+        END IF;
+
+        v_before := COALESCE(v_daily, 0);
+
+        IF p_rampage_hit THEN
+            UPDATE pf_user_counters
+            SET daily_calories = GREATEST(0, daily_calories - p_penalty),
+                total_calories = GREATEST(0, total_calories - p_penalty),
+                last_snack = p_now
+            WHERE user_id = p_user_id
+            RETURNING pf_user_counters.daily_calories, pf_user_counters.total_calories INTO v_daily, v_total;
+
+            RETURN QUERY SELECT 'RAMPAGE_HIT'::TEXT, 0, v_daily, v_total, v_daily - v_before;
+            RETURN;
+        END IF;
+
+        IF COALESCE(v_heat, 0) > 60 AND p_confiscate THEN
+            UPDATE pf_user_counters SET last_snack = p_now WHERE user_id = p_user_id;
+            RETURN QUERY SELECT 'CONFISCATED'::TEXT, 0, COALESCE(v_daily, 0), COALESCE(v_total, 0), 0;
+            RETURN;
+        END IF;
+
+        UPDATE pf_user_counters
+        SET daily_calories = COALESCE(daily_calories, 0) + p_calories,
+            total_calories = GREATEST(0, COALESCE(total_calories, 0) + p_calories),
+            last_snack = p_now
+        WHERE user_id = p_user_id
+        RETURNING pf_user_counters.daily_calories, pf_user_counters.total_calories INTO v_daily, v_total;
+
+        RETURN QUERY SELECT 'FED'::TEXT, 0, v_daily, v_total, v_daily - v_before;
+    END;
+    $$;
+"""
+
+HACK_FUNCTION_SQL = """
+    DROP FUNCTION IF EXISTS pf_hack(BIGINT, TEXT, TIMESTAMP, NUMERIC);
+    CREATE FUNCTION pf_hack(
+        p_user_id BIGINT,
+        p_username TEXT,
+        p_now TIMESTAMP,
+        p_gain NUMERIC
     )
+    RETURNS TABLE (
+        outcome TEXT,
+        wait_seconds INTEGER,
+        in_icu BOOLEAN,
+        clog DOUBLE PRECISION,
+        icu_visits INTEGER
+    )
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        v_clog NUMERIC;
+        v_icu BOOLEAN;
+        v_last TIMESTAMP;
+        v_visits INTEGER;
+        v_cooldown INTERVAL;
+    BEGIN
+        PERFORM pf_roll_day(p_user_id, pf_day_epoch(p_now));
+
+        INSERT INTO pf_users (user_id, username)
+        VALUES (p_user_id, p_username)
+        ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+        WHERE pf_users.username IS DISTINCT FROM EXCLUDED.username;
+
+        INSERT INTO pf_user_counters (user_id, day_epoch)
+        VALUES (p_user_id, pf_day_epoch(p_now))
+        ON CONFLICT (user_id) DO NOTHING;
+
+        SELECT c.daily_clog, c.is_icu, c.last_hack, u.icu_lifetime
+        INTO v_clog, v_icu, v_last, v_visits
+        FROM pf_user_counters c
+        JOIN pf_users u ON u.user_id = c.user_id
+        WHERE c.user_id = p_user_id
+        FOR UPDATE OF c;
+
+        v_clog := COALESCE(v_clog, 0);
+        v_icu := COALESCE(v_icu, FALSE);
+        v_cooldown := CASE WHEN v_icu THEN INTERVAL '2 hours' ELSE INTERVAL '1 hour' END;
+
+        IF v_last IS NOT NULL AND p_now - v_last < v_cooldown THEN
+            RETURN QUERY SELECT 'COOLDOWN'::TEXT,
+                FLOOR(EXTRACT(EPOCH FROM v_cooldown - (p_now - v_last)))::INTEGER,
+                v_icu, v_clog::DOUBLE PRECISION, COALESCE(v_visits, 0);
+            RETURN;
+        END IF;
+
+        v_clog := v_clog + p_gain;
+
+        IF v_clog >= 100 THEN
+            UPDATE pf_user_counters
+            SET daily_clog = 0,
+                is_icu = TRUE,
+                last_hack = p_now
+            WHERE user_id = p_user_id;
+            UPDATE pf_users
+            SET icu_lifetime = COALESCE(icu_lifetime, 0) + 1
+            WHERE user_id = p_user_id
+            RETURNING pf_users.icu_lifetime INTO v_visits;
+            RETURN QUERY SELECT 'FLATLINE'::TEXT, 0, TRUE, v_clog::DOUBLE PRECISION, v_visits;
+        ELSE
+            UPDATE pf_user_counters
+            SET daily_clog = v_clog,
+                is_icu = FALSE,
+                last_hack = p_now
+            WHERE user_id = p_user_id;
+            RETURN QUERY SELECT 'HACKED'::TEXT, 0, FALSE, v_clog::DOUBLE PRECISION, COALESCE(v_visits, 0);
+        END IF;
+    END;
+    $$;
+"""
+
+# Every public board is "top N by one column" over the same visible-user filter,
+# so each gets a partial index in that order with the displayed columns included.
+# Counter boards walk pf_user_counters in order and join pf_users for the name
+# and the leaderboard flag, which stay behind with the rarely written columns.
+BOARD_FILTER = "user_id <> 0 AND COALESCE(leaderboard_enabled, TRUE) = TRUE"
+INDEXES = [
+    ("pf_user_counters_board_total_idx",
+     "pf_user_counters (total_calories DESC) INCLUDE (user_id) WHERE user_id <> 0"),
+    ("pf_user_counters_board_day_daily_idx",
+     "pf_user_counters (day_epoch, daily_calories DESC) INCLUDE (user_id) WHERE user_id <> 0"),
+    ("pf_user_counters_board_day_clog_idx",
+     "pf_user_counters (day_epoch, daily_clog DESC) INCLUDE (user_id) WHERE user_id <> 0"),
+    ("pf_user_counters_prev_epoch_idx",
+     "pf_user_counters (prev_epoch) INCLUDE (user_id, prev_daily_calories, prev_daily_clog) WHERE user_id <> 0"),
+    ("pf_users_board_deaths_idx",
+     f"pf_users (icu_lifetime DESC) INCLUDE (username) WHERE {BOARD_FILTER} AND icu_lifetime > 0"),
+    ("pf_users_board_daily_wins_idx",
+     f"pf_users (lifetime_daily_wins DESC) INCLUDE (username) WHERE {BOARD_FILTER} AND lifetime_daily_wins > 0"),
+    ("pf_users_board_hack_wins_idx",
+     f"pf_users (lifetime_hack_wins DESC) INCLUDE (username) WHERE {BOARD_FILTER} AND lifetime_hack_wins > 0"),
+    ("pf_user_counters_day_heat_idx",
+     "pf_user_counters (day_epoch, heat_level DESC, total_calories DESC) WHERE user_id <> 0 AND heat_level > 0"),
+    ("pf_users_username_lower_idx",
+     "pf_users (LOWER(username))"),
+    ("pf_gifts_unopened_idx",
+     "pf_gifts (receiver_id, id DESC) WHERE is_opened = FALSE"),
+    # raw events are append-only in time order, so a BRIN stays tiny
+    ("pf_events_created_brin",
+     "pf_events USING BRIN (created_at)")
+]
+
+# superseded by the day_epoch-keyed versions above, then by the pf_user_counters ones
+OBSOLETE_INDEXES = [
+    "pf_users_board_daily_idx", "pf_users_board_clog_idx", "pf_users_heat_idx",
+    "pf_users_board_total_idx", "pf_users_board_day_daily_idx", "pf_users_board_day_clog_idx",
+    "pf_users_prev_epoch_idx", "pf_users_day_heat_idx"
+]
+
+def ensure_indexes(conn):
+    """Builds missing indexes without blocking writers and rebuilds any left invalid by a failed build.
+
+    Returns True when every index is valid."""
+    conn.autocommit = True
+    cur = conn.cursor()
+    ok = True
+    try:
+        for name in OBSOLETE_INDEXES:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+        for name, definition in INDEXES:
+            cur.execute("""
+                SELECT i.indisvalid
+                FROM pg_class c
+                JOIN pg_index i ON i.indexrelid = c.oid
+                WHERE c.relname = %s
+            """, (name,))
+            row = cur.fetchone()
+            if row and row[0]:
+                continue
+            if row:
+                logger.warning(f"Rebuilding invalid index {name}")
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            try:
+                cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+                logger.info(f"📇 Index ready: {name}")
+            except Exception as e:
+                ok = False
+                logger.error(f"Index Build Error ({name}): {e}")
+    finally:
+        cur.close()
+        conn.autocommit = False
+    return ok
+
+# --- Versioned migrations ---
+# Each step runs exactly once, in order, and bumps schema_version in the same
+# transaction. Stored functions and indexes are "repeatable": they are
+# reapplied only when the definitions in this file change (tracked by hash),
+# so booting against an up-to-date database costs a single SELECT.
+def migrate_base_tables(cur, bot_id):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            total_calories BIGINT DEFAULT 0,
+            daily_calories INTEGER DEFAULT 0,
+            daily_clog NUMERIC DEFAULT 0,
+            is_icu BOOLEAN DEFAULT FALSE,
+            last_snack TIMESTAMP,
+            last_hack TIMESTAMP,
+            ping_sent TIMESTAMP,
+            last_gift_sent TIMESTAMP,
+            last_pfp_gen TIMESTAMP,
+            sabotage_val BIGINT DEFAULT 0,
+            gifts_sent_val BIGINT DEFAULT 0
+        );
+    """)
+    # databases created before this runner picked these up one ALTER per boot
+    cur.execute("""
+        ALTER TABLE pf_users
+            ADD COLUMN IF NOT EXISTS last_pfp_gen TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS icu_lifetime INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS smack_count INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_smack_time TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS smack_ids TEXT DEFAULT '',
+            ADD COLUMN IF NOT EXISTS daily_ko_count INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_ko_time TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS lifetime_daily_wins INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS lifetime_hack_wins INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS heat_level INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS rampage_until TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS last_rage_announce_level INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_rampage_reminder_at TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS rampage_end_announced_for TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS leaderboard_enabled BOOLEAN DEFAULT TRUE
+    """)
+
+    cur.execute("""
+        INSERT INTO pf_users (user_id, username, total_calories, daily_calories)
+        VALUES (0, 'KITCHEN_SYSTEM', 0, 0)
+        ON CONFLICT (user_id) DO NOTHING
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_airdrop_winners (
+            id SERIAL PRIMARY KEY,
+            winner_type TEXT,
+            username TEXT,
+            score NUMERIC,
+            win_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
 
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_gifts (
+            id SERIAL PRIMARY KEY,
+            sender_id BIGINT,
+            sender_name TEXT,
+            receiver_id BIGINT,
+            item_name TEXT,
+            item_type TEXT,
+            value INTEGER,
+            flavor_text TEXT,
+            is_opened BOOLEAN DEFAULT FALSE
+        );
+    """)
+
+def migrate_hide_removed_users(cur, bot_id):
     cur.execute("""
         UPDATE pf_users
-        SET last_rampage_reminder_at = %s
-        WHERE user_id = 0
-    """, (now,))
-    conn.commit()
+        SET leaderboard_enabled = FALSE
+        WHERE LOWER(REPLACE(COALESCE(username, ''), '@', '')) IN (%s, %s)
+    """, REMOVED_LEADERBOARD_USERS)
 
-async def maybe_send_rampage_end(bot, cur, conn, old_until, now):
-    if not old_until or old_until > now:
-        return
+def migrate_drop_bot_gifts(cur, bot_id):
+    # /gift refuses the bot as a receiver now, so this only clears old rows
+    if bot_id:
+        cur.execute("DELETE FROM pf_gifts WHERE receiver_id = %s", (bot_id,))
+
+def migrate_day_epochs(cur, bot_id):
+    # existing rows are stamped with the current day when the column is added
+    cur.execute("""
+        ALTER TABLE pf_users
+            ADD COLUMN IF NOT EXISTS day_epoch INTEGER DEFAULT FLOOR(EXTRACT(EPOCH FROM NOW() - INTERVAL '1 hour') / 86400)::INTEGER,
+            ADD COLUMN IF NOT EXISTS prev_epoch INTEGER,
+            ADD COLUMN IF NOT EXISTS prev_daily_calories INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS prev_daily_clog NUMERIC DEFAULT 0
+    """)
 
     cur.execute("""
-        SELECT rampage_end_announced_for
+        CREATE TABLE IF NOT EXISTS pf_job_runs (
+            job_name TEXT PRIMARY KEY,
+            last_run_key INTEGER,
+            last_run_at TIMESTAMP
+        );
+    """)
+    # a fresh install starts with yesterday already closed
+    cur.execute("""
+        INSERT INTO pf_job_runs (job_name, last_run_key, last_run_at)
+        VALUES ('daily_reset', %s, NOW())
+        ON CONFLICT (job_name) DO NOTHING
+    """, (day_epoch() - 1,))
+
+def migrate_smack_window(cur, bot_id):
+    # one row per attacker in a target's open window; replaces the smack_ids string
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_smack_window (
+            target_id BIGINT NOT NULL,
+            attacker_id BIGINT NOT NULL,
+            smacked_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (target_id, attacker_id)
+        );
+    """)
+    # carry over windows that are still open; smack_count/smack_ids/last_smack_time are left unread
+    cur.execute("""
+        INSERT INTO pf_smack_window (target_id, attacker_id, smacked_at)
+        SELECT u.user_id, a.attacker_id::BIGINT, u.last_smack_time
+        FROM pf_users u
+        CROSS JOIN LATERAL unnest(string_to_array(u.smack_ids, ',')) AS a(attacker_id)
+        WHERE u.smack_ids <> ''
+          AND a.attacker_id ~ '^[0-9]+$'
+          AND u.last_smack_time > (NOW() AT TIME ZONE 'UTC') - INTERVAL '15 minutes'
+        ON CONFLICT DO NOTHING
+    """)
+
+def migrate_kitchen_table(cur, bot_id):
+    # single-row table; row 0 of pf_users stays only as the /smack kitchen target
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_kitchen (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            meter BIGINT DEFAULT 0,
+            rage INTEGER DEFAULT 0,
+            rampage_until TIMESTAMP,
+            last_rage_announce_level INTEGER DEFAULT 0,
+            last_rampage_reminder_at TIMESTAMP,
+            rampage_end_announced_for TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        INSERT INTO pf_kitchen (id, meter, rage, rampage_until, last_rage_announce_level,
+                                last_rampage_reminder_at, rampage_end_announced_for)
+        SELECT 1, COALESCE(total_calories, 0), COALESCE(daily_calories, 0), rampage_until,
+               COALESCE(last_rage_announce_level, 0), last_rampage_reminder_at, rampage_end_announced_for
         FROM pf_users
         WHERE user_id = 0
+        ON CONFLICT (id) DO NOTHING
     """)
-    row = cur.fetchone()
-    announced_for = row[0] if row else None
+    cur.execute("INSERT INTO pf_kitchen (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
 
-    if announced_for == old_until:
-        return
+def migrate_event_ledger(cur, bot_id):
+    # raw, append-only history; kind codes are EVENT_KINDS
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_events (
+            user_id BIGINT NOT NULL,
+            kind SMALLINT NOT NULL,
+            delta INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        );
+    """)
+    # per-day totals kept current by each flush; history reads only these
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_event_days (
+            day_epoch INTEGER NOT NULL,
+            user_id BIGINT NOT NULL,
+            kind SMALLINT NOT NULL,
+            delta BIGINT NOT NULL DEFAULT 0,
+            events INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day_epoch, user_id, kind)
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS pf_event_days_user_idx ON pf_event_days (user_id, day_epoch)")
 
-    await send_main_chat_message(
-        bot,
-        "🧊 **CHEF HAS COOLED OFF**\nThe kitchen is no longer in rampage mode.\nFor now."
-    )
+def migrate_media_cache(cur, bot_id):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_media_cache (
+            url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
 
+def migrate_user_cooldowns(cur, bot_id):
+    # Gift and PFP cooldowns are written alone, never with an indexed column, so
+    # on a narrow row with free page space every write is a HOT update.
     cur.execute("""
-        UPDATE pf_users
-        SET rampage_end_announced_for = %s,
-            last_rampage_reminder_at = NULL
-        WHERE user_id = 0
-    """, (old_until,))
+        CREATE TABLE IF NOT EXISTS pf_user_cooldowns (
+            user_id BIGINT PRIMARY KEY,
+            last_gift_sent TIMESTAMP,
+            last_pfp_gen TIMESTAMP
+        ) WITH (fillfactor = 70);
+    """)
+    cur.execute("""
+        INSERT INTO pf_user_cooldowns (user_id, last_gift_sent, last_pfp_gen)
+        SELECT user_id, last_gift_sent, last_pfp_gen
+        FROM pf_users
+        WHERE last_gift_sent IS NOT NULL OR last_pfp_gen IS NOT NULL
+        ON CONFLICT (user_id) DO NOTHING
+    """)
+    # moved columns, plus the ones pf_smack_window made dead weight in every tuple
+    cur.execute("""
+        ALTER TABLE pf_users
+            DROP COLUMN IF EXISTS last_gift_sent,
+            DROP COLUMN IF EXISTS last_pfp_gen,
+            DROP COLUMN IF EXISTS smack_ids,
+            DROP COLUMN IF EXISTS smack_count,
+            DROP COLUMN IF EXISTS last_smack_time,
+            DROP COLUMN IF EXISTS ping_sent
+    """)
+    # leave room on each page so updates that skip the board columns can stay HOT
+    cur.execute("ALTER TABLE pf_users SET (fillfactor = 80)")
+
+def migrate_user_counters(cur, bot_id):
+    # Every game action rewrites these, and most writes touch a board column so
+    # they can't be HOT; on a narrow row each one copies a small tuple instead
+    # of the whole pf_users row. The day-roll state moves with them so the
+    # rollover and the day-keyed board indexes stay on one table.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pf_user_counters (
+            user_id BIGINT PRIMARY KEY,
+            day_epoch INTEGER DEFAULT FLOOR(EXTRACT(EPOCH FROM NOW() - INTERVAL '1 hour') / 86400)::INTEGER,
+            total_calories BIGINT DEFAULT 0,
+            daily_calories INTEGER DEFAULT 0,
+            daily_clog NUMERIC DEFAULT 0,
+            heat_level INTEGER DEFAULT 0,
+            is_icu BOOLEAN DEFAULT FALSE,
+            last_snack TIMESTAMP,
+            last_hack TIMESTAMP,
+            daily_ko_count INTEGER DEFAULT 0,
+            last_ko_time TIMESTAMP,
+            prev_epoch INTEGER,
+            prev_daily_calories INTEGER DEFAULT 0,
+            prev_daily_clog NUMERIC DEFAULT 0
+        ) WITH (fillfactor = 80);
+    """)
+    cur.execute("""
+        INSERT INTO pf_user_counters (
+            user_id, day_epoch, total_calories, daily_calories, daily_clog, heat_level, is_icu,
+            last_snack, last_hack, daily_ko_count, last_ko_time, prev_epoch, prev_daily_calories, prev_daily_clog
+        )
+        SELECT user_id, day_epoch, total_calories, daily_calories, daily_clog, heat_level, is_icu,
+               last_snack, last_hack, daily_ko_count, last_ko_time, prev_epoch, prev_daily_calories, prev_daily_clog
+        FROM pf_users
+        ON CONFLICT (user_id) DO NOTHING
+    """)
+    # the board indexes on these columns go with them
+    cur.execute("""
+        ALTER TABLE pf_users
+            DROP COLUMN IF EXISTS day_epoch,
+            DROP COLUMN IF EXISTS total_calories,
+            DROP COLUMN IF EXISTS daily_calories,
+            DROP COLUMN IF EXISTS daily_clog,
+            DROP COLUMN IF EXISTS heat_level,
+            DROP COLUMN IF EXISTS is_icu,
+            DROP COLUMN IF EXISTS last_snack,
+            DROP COLUMN IF EXISTS last_hack,
+            DROP COLUMN IF EXISTS daily_ko_count,
+            DROP COLUMN IF EXISTS last_ko_time,
+            DROP COLUMN IF EXISTS prev_epoch,
+            DROP COLUMN IF EXISTS prev_daily_calories,
+            DROP COLUMN IF EXISTS prev_daily_clog
+    """)
+
+# append only: never renumber or edit a step that has shipped
+MIGRATIONS = [
+    (1, "base tables", migrate_base_tables),
+    (2, "hide removed leaderboard users", migrate_hide_removed_users),
+    (3, "drop gifts addressed to the bot", migrate_drop_bot_gifts),
+    (4, "day epochs and job runs", migrate_day_epochs),
+    (5, "smack window table", migrate_smack_window),
+    (6, "kitchen table", migrate_kitchen_table),
+    (7, "event ledger and daily rollups", migrate_event_ledger),
+    (8, "telegram media file_id cache", migrate_media_cache),
+    (9, "narrow cooldown table and slimmer pf_users", migrate_user_cooldowns),
+    (10, "per-action counters in a narrow table", migrate_user_counters),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+ROUTINES = [DAY_FUNCTIONS_SQL, SNACK_FUNCTION_SQL, HACK_FUNCTION_SQL]
+ROUTINES_HASH = hashlib.sha256("\n".join(ROUTINES).encode()).hexdigest()[:16]
+INDEXES_HASH = hashlib.sha256(repr((INDEXES, OBSOLETE_INDEXES)).encode()).hexdigest()[:16]
+
+MIGRATION_LOCK_ID = 74_610_001  # pg advisory lock shared by every booting instance
+INDEX_LOCK_ID = 74_610_002      # held only while building indexes, never waited on
+
+def read_schema_state(conn, cur):
+    """Returns (version, routines_hash, indexes_hash); a database without the table is version 0."""
+    try:
+        cur.execute("SELECT version, routines_hash, indexes_hash FROM schema_version")
+        row = cur.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return 0, None, None
+    return row if row else (0, None, None)
+
+def build_indexes(conn, cur):
+    """Runs ensure_indexes on one instance at a time; the others skip rather than wait."""
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (INDEX_LOCK_ID,))
+    locked = cur.fetchone()[0]
     conn.commit()
+    if not locked:
+        logger.info("📇 Another instance is building indexes.")
+        return
+    try:
+        if ensure_indexes(conn):
+            cur.execute("UPDATE schema_version SET indexes_hash = %s, updated_at = NOW()", (INDEXES_HASH,))
+            conn.commit()
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (INDEX_LOCK_ID,))
+        conn.commit()
 
-# ==========================================
-# 3. DATABASE INITIALIZATION & MIGRATIONS
-# ==========================================
 def init_db(bot_id=None):
     conn = None
     cur = None
@@ -431,102 +1392,54 @@ def init_db(bot_id=None):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS pf_users (
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                total_calories BIGINT DEFAULT 0,
-                daily_calories INTEGER DEFAULT 0,
-                daily_clog NUMERIC DEFAULT 0,
-                is_icu BOOLEAN DEFAULT FALSE,
-                last_snack TIMESTAMP,
-                last_hack TIMESTAMP,
-                ping_sent TIMESTAMP,
-                last_gift_sent TIMESTAMP,
-                last_pfp_gen TIMESTAMP,
-                sabotage_val BIGINT DEFAULT 0,
-                gifts_sent_val BIGINT DEFAULT 0,
-                icu_lifetime INTEGER DEFAULT 0,
-                smack_count INTEGER DEFAULT 0,
-                last_smack_time TIMESTAMP,
-                smack_ids TEXT DEFAULT '',
-                daily_ko_count INTEGER DEFAULT 0,
-                last_ko_time TIMESTAMP,
-                lifetime_daily_wins INTEGER DEFAULT 0,
-                lifetime_hack_wins INTEGER DEFAULT 0,
-                heat_level INTEGER DEFAULT 0,
-                rampage_until TIMESTAMP,
-                last_rage_announce_level INTEGER DEFAULT 0,
-                last_rampage_reminder_at TIMESTAMP,
-                rampage_end_announced_for TIMESTAMP,
-                leaderboard_enabled BOOLEAN DEFAULT TRUE
-            );
-        """)
-
-        migrations = [
-            ("last_pfp_gen", "TIMESTAMP"),
-            ("icu_lifetime", "INTEGER DEFAULT 0"),
-            ("smack_count", "INTEGER DEFAULT 0"),
-            ("last_smack_time", "TIMESTAMP"),
-            ("smack_ids", "TEXT DEFAULT ''"),
-            ("daily_ko_count", "INTEGER DEFAULT 0"),
-            ("last_ko_time", "TIMESTAMP"),
-            ("lifetime_daily_wins", "INTEGER DEFAULT 0"),
-            ("lifetime_hack_wins", "INTEGER DEFAULT 0"),
-            ("heat_level", "INTEGER DEFAULT 0"),
-            ("rampage_until", "TIMESTAMP"),
-            ("last_rage_announce_level", "INTEGER DEFAULT 0"),
-            ("last_rampage_reminder_at", "TIMESTAMP"),
-            ("rampage_end_announced_for", "TIMESTAMP"),
-            ("leaderboard_enabled", "BOOLEAN DEFAULT TRUE")
-        ]
-        for col_name, col_type in migrations:
-            try:
-                cur.execute(f"ALTER TABLE pf_users ADD COLUMN IF NOT EXISTS {col_name} {col_type};")
+        state = read_schema_state(conn, cur)
+        if state == (SCHEMA_VERSION, ROUTINES_HASH, INDEXES_HASH):
+            conn.rollback()
+            logger.info(f"🗄️ Schema up to date (v{SCHEMA_VERSION}).")
+            return
+
+        # several instances may boot together; the first one migrates, the rest re-read
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER NOT NULL,
+                    routines_hash TEXT,
+                    indexes_hash TEXT,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            conn.commit()
+            version, routines_hash, indexes_hash = read_schema_state(conn, cur)
+            if version == 0:
+                cur.execute("INSERT INTO schema_version (version) VALUES (0)")
                 conn.commit()
-            except Exception:
-                conn.rollback()
 
-        cur.execute("""
-            INSERT INTO pf_users (user_id, username, total_calories, daily_calories)
-            VALUES (0, 'KITCHEN_SYSTEM', 0, 0)
-            ON CONFLICT (user_id) DO NOTHING
-        """)
+            for step_version, description, step in MIGRATIONS:
+                if step_version <= version:
+                    continue
+                step(cur, bot_id)
+                cur.execute("UPDATE schema_version SET version = %s, updated_at = NOW()", (step_version,))
+                conn.commit()
+                logger.info(f"🗄️ Migration {step_version} applied: {description}")
 
-        cur.execute("""
-            UPDATE pf_users
-            SET leaderboard_enabled = FALSE
-            WHERE LOWER(REPLACE(COALESCE(username, ''), '@', '')) IN (%s, %s)
-        """, REMOVED_LEADERBOARD_USERS)
-
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS pf_airdrop_winners (
-                id SERIAL PRIMARY KEY,
-                winner_type TEXT,
-                username TEXT,
-                score NUMERIC,
-                win_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS pf_gifts (
-                id SERIAL PRIMARY KEY,
-                sender_id BIGINT,
-                sender_name TEXT,
-                receiver_id BIGINT,
-                item_name TEXT,
-                item_type TEXT,
-                value INTEGER,
-                flavor_text TEXT,
-                is_opened BOOLEAN DEFAULT FALSE
-            );
-        """)
-
-        if bot_id:
-            cur.execute("DELETE FROM pf_gifts WHERE receiver_id = %s", (bot_id,))
+            if routines_hash != ROUTINES_HASH:
+                for sql in ROUTINES:
+                    cur.execute(sql)
+                cur.execute("UPDATE schema_version SET routines_hash = %s, updated_at = NOW()", (ROUTINES_HASH,))
+                conn.commit()
+                logger.info("🗄️ Stored functions refreshed.")
 
-        conn.commit()
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+
+        # CREATE INDEX CONCURRENTLY waits out every open transaction, including another
+        # instance's pg_advisory_lock wait above, so indexes are built only after the unlock
+        if indexes_hash != INDEXES_HASH:
+            build_indexes(conn, cur)
     except Exception as e:
         if conn:
             conn.rollback()
@@ -534,272 +1447,409 @@ def init_db(bot_id=None):
     finally:
         safe_close(cur, conn)
 
-# ==========================================
-# 4. AUTOMATED TASKS
-# ==========================================
-async def automated_reset_task(application):
-    while True:
-        now_utc = datetime.utcnow()
-        if now_utc.hour == 1 and now_utc.minute == 0:
-            conn = None
-            cur = None
-            try:
-                conn = get_db_connection()
-                cur = conn.cursor()
-
-                for label, col in [('DAILY PHATTEST', 'daily_calories'), ('TOP HACKER', 'daily_clog')]:
-                    cur.execute(f"""
-                        SELECT user_id, username, {col}
-                        FROM pf_users
-                        WHERE user_id != 0
-                          AND {col} > 0
-                          AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-                        ORDER BY {col} DESC
-                        LIMIT 1
-                    """)
-                    winner = cur.fetchone()
-                    if winner:
-                        w_id, w_name, w_score = winner
-                        cur.execute(
-                            "INSERT INTO pf_airdrop_winners (winner_type, username, score) VALUES (%s, %s, %s)",
-                            (label, w_name, w_score)
-                        )
-                        win_col = "lifetime_daily_wins" if label == 'DAILY PHATTEST' else "lifetime_hack_wins"
-                        cur.execute(f"UPDATE pf_users SET {win_col} = {win_col} + 1 WHERE user_id = %s", (w_id,))
-
-                cur.execute("DELETE FROM pf_airdrop_winners WHERE win_date < NOW() - INTERVAL '7 days'")
-                cur.execute("""
-                    UPDATE pf_users
-                    SET daily_calories = 0,
-                        daily_clog = 0,
-                        is_icu = FALSE,
-                        daily_ko_count = 0,
-                        heat_level = 0,
-                        rampage_until = NULL,
-                        last_rage_announce_level = 0,
-                        last_rampage_reminder_at = NULL,
-                        rampage_end_announced_for = NULL,
-                        last_snack = NULL,
-                        last_hack = NULL
-                """)
+async def load_kitchen():
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute(f"SELECT {', '.join(KitchenState.FIELDS)} FROM pf_kitchen WHERE id = 1")
+        KITCHEN.load(cur.fetchone())
+        logger.info(f"👨‍🍳 Kitchen loaded (rage {KITCHEN.rage}, meter {KITCHEN.meter}).")
+    except Exception as e:
+        logger.error(f"Kitchen Load Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-                conn.commit()
-                logger.info("🧹 Daily Reset & Win Tracking Complete.")
-            except Exception as e:
-                if conn:
-                    conn.rollback()
-                logger.error(f"Reset Error: {e}")
-            finally:
-                safe_close(cur, conn)
-            await asyncio.sleep(61)
-        await asyncio.sleep(30)
-
-async def check_pings(application):
-    while True:
-        await asyncio.sleep(60)
-        pass
+async def flush_kitchen():
+    """Writes the in-process kitchen to pf_kitchen if anything changed since the last flush."""
+    # never overwrite the stored kitchen with defaults from a failed load
+    if not KITCHEN.loaded or not KITCHEN.dirty:
+        return
+    version, row = KITCHEN.row()
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("""
+            UPDATE pf_kitchen
+            SET meter = %s,
+                rage = %s,
+                rampage_until = %s,
+                last_rage_announce_level = %s,
+                last_rampage_reminder_at = %s,
+                rampage_end_announced_for = %s,
+                updated_at = NOW()
+            WHERE id = 1
+        """, row)
+        await conn.commit()
+        KITCHEN.mark_flushed(version)
+    except Exception as e:
+        KITCHEN.stats["flush_errors"] += 1
+        if conn:
+            await conn.rollback()
+        logger.error(f"Kitchen Flush Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-async def chef_rampage_task(application):
-    global LAST_CHEF_HUNT_AT
-    while True:
-        await asyncio.sleep(30)
+async def load_gif_cache():
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("SELECT url, file_id FROM pf_media_cache")
+        GIF_CACHE.load(cur.fetchall())
+    except Exception as e:
+        logger.error(f"GIF Cache Load Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-        conn = None
-        cur = None
-        try:
-            now = datetime.utcnow()
+async def load_usernames():
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("SELECT user_id, username FROM pf_users WHERE user_id <> 0 AND username IS NOT NULL")
+        USERNAMES.load(cur.fetchall())
+    except Exception as e:
+        logger.error(f"Username Index Load Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-            if LAST_CHEF_HUNT_AT and (now - LAST_CHEF_HUNT_AT) < timedelta(minutes=RAMPAGE_HUNT_COOLDOWN_MINUTES):
-                continue
+async def load_rank_index():
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("""
+            SELECT u.user_id,
+                   c.total_calories,
+                   CASE WHEN c.day_epoch = %s THEN c.daily_calories ELSE 0 END,
+                   CASE WHEN c.day_epoch = %s THEN c.daily_clog ELSE 0 END,
+                   u.icu_lifetime
+            FROM pf_users u
+            JOIN pf_user_counters c ON c.user_id = u.user_id
+            WHERE u.user_id != 0
+              AND COALESCE(u.leaderboard_enabled, TRUE) = TRUE
+        """, (day_epoch(), day_epoch()))
+        rows = cur.fetchall()
+        await cur.execute("SELECT user_id FROM pf_users WHERE leaderboard_enabled = FALSE")
+        hidden = [r[0] for r in cur.fetchall()]
+        RANKS.load(rows, excluded=hidden)
+        logger.info(f"📊 Rank index loaded ({len(rows)} users).")
+    except Exception as e:
+        logger.error(f"Rank Index Load Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-            conn = get_db_connection()
-            cur = conn.cursor()
+# ==========================================
+# 4. AUTOMATED TASKS
+# ==========================================
+def epoch_start(epoch):
+    return datetime(1970, 1, 1) + timedelta(days=epoch, hours=DAILY_RESET_HOUR)
+
+async def daily_reset_job(context: ContextTypes.DEFAULT_TYPE):
+    """Closes every game day that ended since the last successful run, so downtime never skips a reset."""
+    now_utc = datetime.utcnow()
+    current_epoch = day_epoch(now_utc)
+    # buffered deltas from before midnight are credited to the day that is about to close
+    await flush_calories()
+    conn = None
+    cur = None
+    try:
+        conn = await db_connect()
+        cur = conn.cursor()
 
-            cur.execute("""
-                SELECT daily_calories, rampage_until
-                FROM pf_users
-                WHERE user_id = 0
-            """)
-            kitchen = cur.fetchone()
-            if not kitchen:
-                continue
+        # Row lock keeps a second replica from closing the same day twice
+        await cur.execute("SELECT last_run_key FROM pf_job_runs WHERE job_name = 'daily_reset' FOR UPDATE")
+        row = cur.fetchone()
+        last_closed = row[0] if row else current_epoch - 2
+        if last_closed >= current_epoch - 1:
+            await conn.rollback()
+            return
+
+        first_epoch = max(last_closed + 1, current_epoch - RESET_CATCHUP_DAYS)
+        for closing_epoch in range(first_epoch, current_epoch):
+            for label, col in [('DAILY PHATTEST', 'daily_calories'), ('TOP HACKER', 'daily_clog')]:
+                # Rows still on the closing day, plus any already rolled over since midnight
+                await cur.execute(f"""
+                    SELECT closing.user_id, u.username, closing.score
+                    FROM (
+                        SELECT user_id, {col} AS score
+                        FROM pf_user_counters
+                        WHERE day_epoch = %s
+                          AND user_id != 0
+                        UNION ALL
+                        SELECT user_id, prev_{col} AS score
+                        FROM pf_user_counters
+                        WHERE prev_epoch = %s
+                          AND user_id != 0
+                    ) closing
+                    JOIN pf_users u ON u.user_id = closing.user_id
+                    WHERE closing.score > 0
+                      AND COALESCE(u.leaderboard_enabled, TRUE) = TRUE
+                    ORDER BY closing.score DESC
+                    LIMIT 1
+                """, (closing_epoch, closing_epoch))
+                winner = cur.fetchone()
+                if winner:
+                    w_id, w_name, w_score = winner
+                    await cur.execute(
+                        "INSERT INTO pf_airdrop_winners (winner_type, username, score, win_date) VALUES (%s, %s, %s, %s)",
+                        (label, w_name, w_score, epoch_start(closing_epoch + 1))
+                    )
+                    win_col = "lifetime_daily_wins" if label == 'DAILY PHATTEST' else "lifetime_hack_wins"
+                    await cur.execute(f"UPDATE pf_users SET {win_col} = {win_col} + 1 WHERE user_id = %s", (w_id,))
+
+        await cur.execute("DELETE FROM pf_airdrop_winners WHERE win_date < NOW() - INTERVAL '7 days'")
+        # windows nobody smacked into again are only cleared lazily by /smack
+        await cur.execute("""
+            DELETE FROM pf_smack_window w
+            WHERE NOT EXISTS (
+                SELECT 1 FROM pf_smack_window x
+                WHERE x.target_id = w.target_id AND x.smacked_at > %s
+            )
+        """, (datetime.utcnow() - SMACK_WINDOW,))
+        await cur.execute("""
+            INSERT INTO pf_job_runs (job_name, last_run_key, last_run_at)
+            VALUES ('daily_reset', %s, %s)
+            ON CONFLICT (job_name) DO UPDATE SET
+                last_run_key = EXCLUDED.last_run_key,
+                last_run_at = EXCLUDED.last_run_at
+        """, (current_epoch - 1, now_utc))
+
+        await conn.commit()
+        # Player rows roll over lazily; only the kitchen resets here
+        KITCHEN.reset_day()
+        # holds were already capped at the rollover; this just frees the memory
+        COOLDOWNS.clear("snack", "hack")
+        COOLDOWNS.prune(datetime.utcnow())
+        BOARD_CACHE.clear()
+        RANKS.reset("daily_calories", "daily_clog")
+        logger.info(f"🧹 Daily Reset & Win Tracking Complete (days {first_epoch}..{current_epoch - 1}).")
+    except Exception as e:
+        if conn:
+            await conn.rollback()
+        logger.error(f"Reset Error: {e}")
+    finally:
+        safe_close(cur, conn)
 
-            chef_rage = kitchen[0] or 0
-            rampage_until = kitchen[1]
+async def calorie_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    await flush_calories()
+
+async def event_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    await flush_events()
+
+async def prewarm_gifs_job(context: ContextTypes.DEFAULT_TYPE):
+    """Uploads every catalog gif without a file_id to the pre-warm chat once, then deletes the message."""
+    missing = GIF_CACHE.missing(f.gif for f in CONTENT.catalog.foods)
+    for url in missing:
+        # the background lane only gets tokens that live traffic leaves unused
+        sent = await SEND_QUEUE.submit(
+            GIF_PREWARM_CHAT_ID,
+            lambda url=url: context.bot.send_animation(chat_id=GIF_PREWARM_CHAT_ID, animation=url, disable_notification=True),
+            LANE_BACKGROUND
+        )
+        if not sent:
+            continue
+        if sent.animation:
+            await store_file_id(url, sent.animation.file_id)
+            GIF_CACHE.stats["prewarmed"] += 1
+        SEND_QUEUE.submit(GIF_PREWARM_CHAT_ID, sent.delete, LANE_BACKGROUND)
+    if missing:
+        logger.info(f"🎞️ GIF pre-warm done ({GIF_CACHE.stats['prewarmed']}/{len(missing)}).")
+
+async def username_refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    await load_usernames()
+
+async def content_reload_job(context: ContextTypes.DEFAULT_TYPE):
+    """Recompiles content off the loop when a JSON file changes, then swaps it in with one assignment."""
+    global CONTENT
+    if not CONTENT_WATCHER.changed():
+        return
+    fresh = await asyncio.get_running_loop().run_in_executor(None, CONTENT_WATCHER.reload)
+    if fresh is not None:
+        CONTENT = fresh
+        logger.info(f"📚 Content reloaded ({len(fresh.catalog.foods)} foods, {len(fresh.catalog.hacks)} hacks).")
+
+async def kitchen_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    if not KITCHEN.loaded:
+        await load_kitchen()
+        return
+    await flush_kitchen()
 
-            await maybe_send_rampage_end(application.bot, cur, conn, rampage_until, now)
-            await maybe_send_rampage_reminder(application.bot, cur, conn, rampage_until, now)
+def request_kitchen_tick(job_queue, when=None):
+    """Schedules the kitchen to wake at `when` (naive UTC, default now) unless it already wakes sooner."""
+    if not job_queue:
+        return
+    when = max(when or datetime.utcnow(), datetime.utcnow()).replace(tzinfo=timezone.utc)
+    for job in job_queue.get_jobs_by_name("kitchen_tick"):
+        if job.next_t and job.next_t <= when:
+            return
+        job.schedule_removal()
+    job_queue.run_once(kitchen_tick, when=when, name="kitchen_tick")
+
+def wake_kitchen_for_heat(job_queue, rampage_until, now):
+    """Heat only matters during a rampage; make sure the hunter wakes once its cooldown allows."""
+    if not rampage_active_until(rampage_until, now):
+        return
+    hunt_due = LAST_CHEF_HUNT_AT + timedelta(minutes=RAMPAGE_HUNT_COOLDOWN_MINUTES) if LAST_CHEF_HUNT_AT else now
+    request_kitchen_tick(job_queue, hunt_due)
 
-            if not rampage_active_until(rampage_until, now):
-                continue
+async def kitchen_tick(context: ContextTypes.DEFAULT_TYPE):
+    """Runs rampage end/reminder/hunt bookkeeping, then sleeps until the next kitchen deadline."""
+    global LAST_CHEF_HUNT_AT
+    conn = None
+    cur = None
+    next_wake = []
+    # a wake-up requested mid-hunt waits here, then sees the new LAST_CHEF_HUNT_AT
+    await KITCHEN_LOCK.acquire()
+    try:
+        now = datetime.utcnow()
+        rampage_until = KITCHEN.rampage_until
 
-            cur.execute("""
-                SELECT user_id, username, heat_level
-                FROM pf_users
-                WHERE user_id != 0 AND heat_level > 0
-                ORDER BY heat_level DESC, total_calories DESC
-                LIMIT 1
-            """)
-            hunted = cur.fetchone()
+        await maybe_send_rampage_end(context.bot, rampage_until, now)
+        reminder_due = await maybe_send_rampage_reminder(context.bot, rampage_until, now)
 
-            if not hunted:
-                continue
+        if not rampage_active_until(rampage_until, now):
+            return
 
-            hunted_id, hunted_name, hunted_heat = hunted
-            hunt_damage = RAMPAGE_HUNT_DAMAGE
-            new_heat = max(0, (hunted_heat or 0) - 30)
+        next_wake.append(rampage_until)
+        if reminder_due:
+            next_wake.append(reminder_due)
 
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_calories = GREATEST(0, daily_calories - %s),
-                    total_calories = GREATEST(0, total_calories - %s),
-                    heat_level = %s
-                WHERE user_id = %s
-            """, (hunt_damage, hunt_damage, new_heat, hunted_id))
+        hunt_due = LAST_CHEF_HUNT_AT + timedelta(minutes=RAMPAGE_HUNT_COOLDOWN_MINUTES) if LAST_CHEF_HUNT_AT else now
+        if hunt_due > now:
+            next_wake.append(hunt_due)
+            return
 
-            conn.commit()
-            LAST_CHEF_HUNT_AT = now
+        # heat still in the calorie buffer would be invisible to the query below
+        if CALORIE_BUFFER.has_heat():
+            await flush_calories()
 
-            try:
-                mins_left = max(1, int((rampage_until - now).total_seconds() // 60))
-                await send_main_chat_message(
-                    application.bot,
-                    (
-                        f"👨‍🍳 **CHEF HUNT!** @{escape_name(hunted_name)} got caught during rampage.\n"
-                        f"💥 **-{hunt_damage:,} Cal**\n"
-                        f"🌡️ Heat burned down to **{new_heat}**\n"
-                        f"🔥 Rampage still live: **{mins_left}m**\n"
-                        f"🎤 *{random_charlie_quote()}*"
-                    )
-                )
-            except (Forbidden, BadRequest):
-                pass
-            except Exception as dm_err:
-                logger.warning(f"Chef hunt send failed: {dm_err}")
+        conn = await db_connect()
+        cur = conn.cursor()
+        await cur.execute("""
+            SELECT c.user_id, u.username, c.heat_level
+            FROM pf_user_counters c
+            JOIN pf_users u ON u.user_id = c.user_id
+            WHERE c.user_id != 0 AND c.heat_level > 0 AND c.day_epoch = %s
+            ORDER BY c.heat_level DESC, c.total_calories DESC
+            LIMIT 1
+        """, (day_epoch(now),))
+        hunted = cur.fetchone()
+
+        # Nobody is hot: the next smack that adds heat wakes the kitchen again
+        if not hunted:
+            return
+
+        hunted_id, hunted_name, hunted_heat = hunted
+        hunt_damage = RAMPAGE_HUNT_DAMAGE
+        new_heat = max(0, (hunted_heat or 0) - 30)
+
+        hunted_totals = await apply_calorie_delta(cur, hunted_id, -hunt_damage, new_heat - (hunted_heat or 0), "chef_hunt", now)
+
+        await conn.commit()
+        track_calorie_change(hunted_id, hunted_totals)
+        LAST_CHEF_HUNT_AT = now
+        next_wake.append(now + timedelta(minutes=RAMPAGE_HUNT_COOLDOWN_MINUTES))
+
+        mins_left = max(1, int((rampage_until - now).total_seconds() // 60))
+        send_main_chat_message(
+            context.bot,
+            (
+                f"👨‍🍳 **CHEF HUNT!** @{escape_name(hunted_name)} got caught during rampage.\n"
+                f"💥 **-{hunt_damage:,} Cal**\n"
+                f"🌡️ Heat burned down to **{new_heat}**\n"
+                f"🔥 Rampage still live: **{mins_left}m**\n"
+                f"🎤 *{random_charlie_quote()}*"
+            )
+        )
 
-            logger.info(f"👨‍🍳 Passive Chef Hunt hit user_id={hunted_id} heat={hunted_heat} -> {new_heat}")
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            logger.error(f"Chef Rampage Task Error: {e}")
-        finally:
-            safe_close(cur, conn)
+        logger.info(f"👨‍🍳 Passive Chef Hunt hit user_id={hunted_id} heat={hunted_heat} -> {new_heat}")
+    except Exception as e:
+        if conn:
+            await conn.rollback()
+        logger.error(f"Kitchen Tick Error: {e}")
+        next_wake.append(datetime.utcnow() + timedelta(seconds=KITCHEN_RETRY_SECONDS))
+    finally:
+        KITCHEN_LOCK.release()
+        safe_close(cur, conn)
+        if next_wake:
+            request_kitchen_tick(context.job_queue, min(next_wake))
 
 # ==========================================
 # 5. CORE ACTIONS (SNACK & HACK)
 # ==========================================
 async def snack(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user, now = update.effective_user, datetime.utcnow()
-    conn = None
-    cur = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        ensure_user_record(cur, user)
 
-        cur.execute("""
-            SELECT total_calories, daily_calories, last_snack, heat_level
-            FROM pf_users
-            WHERE user_id = %s
-        """, (user.id,))
-        u = cur.fetchone()
+    # Every roll happens up front so pf_snack can settle the whole action in one round trip
+    rampage_hit = random.random() < 0.50
+    rampage_end = random.random() < 0.25
+    confiscate = random.random() < 0.50
 
-        cur.execute("SELECT total_calories, daily_calories, rampage_until FROM pf_users WHERE user_id = 0")
-        kitchen = cur.fetchone()
-        kitchen_meter = kitchen[0] if kitchen else 0
-        chef_rage = kitchen[1] if kitchen else 0
-        kitchen_rampage_until = kitchen[2] if kitchen else None
-
-        c_total = u[0] or 0
-        c_daily = u[1] or 0
-        last_snack = u[2]
-        heat_level = u[3] or 0
-        rampage_live = rampage_active_until(kitchen_rampage_until, now)
-
-        if last_snack and now - last_snack < timedelta(hours=1):
-            rem = timedelta(hours=1) - (now - last_snack)
-            return await update.message.reply_text(f"⌛️ Digesting... {int(rem.total_seconds()//60)}m left.")
-
-        if rampage_live:
-            if random.random() < 0.50:
-                ended_rampage = False
-
-                cur.execute("""
-                    UPDATE pf_users
-                    SET daily_calories = GREATEST(0, daily_calories - %s),
-                        total_calories = GREATEST(0, total_calories - %s),
-                        last_snack = %s
-                    WHERE user_id = %s
-                """, (RAMPAGE_SNACK_PENALTY, RAMPAGE_SNACK_PENALTY, now, user.id))
-
-                if random.random() < 0.25:
-                    cur.execute("""
-                        UPDATE pf_users
-                        SET daily_calories = 0,
-                            rampage_until = NULL,
-                            last_rampage_reminder_at = NULL,
-                            rampage_end_announced_for = NULL
-                        WHERE user_id = 0
-                    """)
-                    ended_rampage = True
+    item = CONTENT.foods.draw()
+    cal_val = item.calories
+    gif_url = item.gif
+    bullish_moon = False
 
-                conn.commit()
+    # True independent 1% jackpot roll
+    if random.random() < 0.01:
+        cal_val = 10000
+        bullish_moon = True
 
-                if ended_rampage:
-                    await send_main_chat_message(
-                        context.bot,
-                        "🧊 **CHEF HAS COOLED OFF**\nThe kitchen is no longer in rampage mode.\nFor now."
-                    )
+    held = COOLDOWNS.check("snack", user.id, now)
+    if held:
+        return nag(update.message, f"⌛️ Digesting... {held[0] // 60}m left.")
 
-                return await update.message.reply_text(
-                    f"🔥 **RAMPAGE MODE!**\n"
-                    f"💀 The Chef caught you slippin! **-{RAMPAGE_SNACK_PENALTY:,} Cal**\n"
-                    f"🎤 *{random_charlie_quote()}*",
-                    parse_mode='Markdown'
+    conn = None
+    try:
+        rampage_live = KITCHEN.rampage_live(now)
+        conn = await db_connect()
+        rows = await conn.execute_atomic(
+            "SELECT outcome, wait_seconds, daily_total, grand_total, daily_delta "
+            "FROM pf_snack(%s, %s, %s, %s, %s, %s, %s)",
+            (user.id, user_record_name(user), now, cal_val, RAMPAGE_SNACK_PENALTY, rampage_live and rampage_hit, confiscate)
+        )
+        outcome, wait_seconds, new_daily, new_total, daily_delta = rows[0]
+        # pf_snack upserted and rolled the row in autocommit
+        USER_RECORDS.remember(user.id, user_record_name(user), day_epoch(now))
+        hold_daily_cooldown("snack", user.id, now, timedelta(seconds=wait_seconds) if outcome == "COOLDOWN" else timedelta(hours=1))
+        if outcome in ("FED", "RAMPAGE_HIT"):
+            track_calorie_change(user.id, (new_total, new_daily))
+        if outcome == "FED":
+            record_event(user.id, "snack", daily_delta, now)
+        elif outcome == "RAMPAGE_HIT":
+            record_event(user.id, "rampage_hit", daily_delta, now)
+
+        if outcome == "COOLDOWN":
+            return nag(update.message, f"⌛️ Digesting... {wait_seconds // 60}m left.")
+
+        if outcome == "RAMPAGE_HIT":
+            if rampage_end and KITCHEN.end_rampage(now):
+                send_main_chat_message(
+                    context.bot,
+                    "🧊 **CHEF HAS COOLED OFF**\nThe kitchen is no longer in rampage mode.\nFor now."
                 )
 
-        if heat_level > 60 and random.random() < 0.50:
-            cur.execute("UPDATE pf_users SET last_snack = %s WHERE user_id = %s", (now, user.id))
-            conn.commit()
-            return await update.message.reply_text(
-                f"👨‍🍳 **FOOD CONFISCATED!** The Chef snatched your plate.\n"
+            return reply(update.message,
+                f"🔥 **RAMPAGE MODE!**\n"
+                f"💀 The Chef caught you slippin! **-{RAMPAGE_SNACK_PENALTY:,} Cal**\n"
                 f"🎤 *{random_charlie_quote()}*",
                 parse_mode='Markdown'
             )
 
-        item = random.choice(foods)
-        cal_val = item.get('calories', 0)
-        gif_url = item.get('gif')
-        bullish_moon = False
-
-        # True independent 1% jackpot roll
-        if random.random() < 0.01:
-            cal_val = 10000
-            bullish_moon = True
-
-        new_daily = c_daily + cal_val
-        new_total = max(0, c_total + cal_val)
-
-        cur.execute("""
-            INSERT INTO pf_users (user_id, username, total_calories, daily_calories, last_snack)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (user_id) DO UPDATE SET
-            username = EXCLUDED.username,
-            total_calories = %s,
-            daily_calories = %s,
-            last_snack = %s
-        """, (
-            user.id,
-            user.username or user.first_name,
-            new_total,
-            new_daily,
-            now,
-            new_total,
-            new_daily,
-            now
-        ))
-
-        conn.commit()
+        if outcome == "CONFISCATED":
+            return reply(update.message,
+                f"👨‍🍳 **FOOD CONFISCATED!** The Chef snatched your plate.\n"
+                f"🎤 *{random_charlie_quote()}*",
+                parse_mode='Markdown'
+            )
 
         if bullish_moon:
             caption = (
@@ -807,92 +1857,82 @@ async def snack(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"🎰 **+10,000 Cal**\n"
                 f"🔥 Daily: {new_daily:,}"
             )
-            await update.message.reply_text(caption, parse_mode='Markdown')
+            reply(update.message, caption, parse_mode='Markdown')
         else:
             sign = "+" if cal_val > 0 else ""
             if rampage_live:
                 caption = (
                     f"🍔 **RAMPAGE SURVIVED!** You escaped the 2k punishment.\n"
-                    f"**{item['name']}** ({sign}{cal_val:,} Cal)\n"
+                    f"**{item.name}** ({sign}{cal_val:,} Cal)\n"
                     f"🔥 Daily: {new_daily:,}"
                 )
             else:
-                caption = f"🍔 **{item['name']}** ({sign}{cal_val:,} Cal)\n🔥 Daily: {new_daily:,}"
+                caption = f"🍔 **{item.name}** ({sign}{cal_val:,} Cal)\n🔥 Daily: {new_daily:,}"
             if gif_url and not bullish_moon:
-                await update.message.reply_animation(animation=gif_url, caption=caption, parse_mode='Markdown')
+                # don't hold the handler while the gif waits for a send slot
+                context.application.create_task(reply_snack_animation(update.message, gif_url, caption))
             else:
-                await update.message.reply_text(caption, parse_mode='Markdown')
+                reply(update.message, caption, parse_mode='Markdown')
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Snack Error: {e}")
-        await update.message.reply_text("❌ Kitchen Busy.")
+        reply(update.message, "❌ Kitchen Busy.")
     finally:
-        safe_close(cur, conn)
+        safe_close(None, conn)
 
 async def hack(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id, now = user.id, datetime.utcnow()
-    conn = None
-    cur = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        ensure_user_record(cur, user)
-
-        cur.execute("SELECT CAST(daily_clog AS FLOAT), is_icu, last_hack FROM pf_users WHERE user_id = %s", (user_id,))
-        u = cur.fetchone()
-        clog, is_icu, l_hack = (u[0] if u else 0.0, u[1] if u else False, u[2] if u else None)
-
-        cd = timedelta(hours=2) if is_icu else timedelta(hours=1)
 
-        if l_hack and now - l_hack < cd:
-            rem = cd - (now - l_hack)
-            return await update.message.reply_text(f"🏥 {'ICU' if is_icu else 'Recovery'}: {int(rem.total_seconds()//60)}m left.")
+    h = CONTENT.hacks.draw()
+    gain = float(random.randint(h.min_clog, h.max_clog))
 
-        h = random.choice(hacks)
-        gain = float(random.randint(int(h.get("min_clog", 1)), int(h.get("max_clog", 5))))
+    bonus_text = ""
+    if random.random() < 0.10:
+        gain += 0.5
+        bonus_text = "🧬 **CELLULAR MUTATION:** +.5% extra clog!\n"
 
-        bonus_text = ""
-        if random.random() < 0.10:
-            gain += 0.5
-            bonus_text = "🧬 **CELLULAR MUTATION:** +.5% extra clog!\n"
+    held = COOLDOWNS.check("hack", user_id, now)
+    if held:
+        return nag(update.message, f"🏥 {'ICU' if held[1] else 'Recovery'}: {held[0] // 60}m left.")
 
-        new_c = clog + gain
-
-        if new_c >= 100:
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_clog = 0,
-                    is_icu = TRUE,
-                    last_hack = %s,
-                    icu_lifetime = icu_lifetime + 1
-                WHERE user_id = %s
-            """, (now, user_id))
-            await update.message.reply_text("💀 **FLATLINE!** Lab failure. ICU for 2 hours.\n📈 Lifetime Visits Logged.")
+    conn = None
+    try:
+        conn = await db_connect()
+        rows = await conn.execute_atomic(
+            "SELECT outcome, wait_seconds, in_icu, clog, icu_visits FROM pf_hack(%s, %s, %s, %s)",
+            (user_id, user_record_name(user), now, gain)
+        )
+        outcome, wait_seconds, is_icu, new_c, icu_visits = rows[0]
+        USER_RECORDS.remember(user_id, user_record_name(user), day_epoch(now))
+        if outcome == "COOLDOWN":
+            hold_daily_cooldown("hack", user_id, now, timedelta(seconds=wait_seconds), is_icu)
         else:
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_clog = %s,
-                    is_icu = FALSE,
-                    last_hack = %s
-                WHERE user_id = %s
-            """, (new_c, now, user_id))
-            await update.message.reply_text(
-                f"🩺 **HACK SUCCESS:** {h.get('name')}\n"
-                f"📋 **Order:** {h.get('blueprint', 'Classified information.')}\n"
+            hold_daily_cooldown("hack", user_id, now, timedelta(hours=2 if outcome == "FLATLINE" else 1), outcome == "FLATLINE")
+        if outcome == "FLATLINE":
+            BOARD_CACHE.invalidate("daily_clog", "icu_lifetime")
+            RANKS.update(user_id, daily_clog=0, icu_lifetime=icu_visits)
+        elif outcome == "HACKED":
+            BOARD_CACHE.invalidate("daily_clog")
+            RANKS.update(user_id, daily_clog=new_c)
+
+        if outcome == "COOLDOWN":
+            return nag(update.message, f"🏥 {'ICU' if is_icu else 'Recovery'}: {wait_seconds // 60}m left.")
+
+        if outcome == "FLATLINE":
+            reply(update.message, "💀 **FLATLINE!** Lab failure. ICU for 2 hours.\n📈 Lifetime Visits Logged.")
+        else:
+            reply(update.message,
+                f"🩺 **HACK SUCCESS:** {h.name}\n"
+                f"📋 **Order:** {h.blueprint}\n"
                 f"{bonus_text}📈 Clog: {new_c:.1f} % (+{gain}%)",
                 parse_mode='Markdown'
             )
-        conn.commit()
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Hack Error: {e}")
-        await update.message.reply_text("⚠️ Lab system jammed.")
+        reply(update.message, "⚠️ Lab system jammed.")
     finally:
-        safe_close(cur, conn)
+        safe_close(None, conn)
 
 # ==========================================
 # 6. SMACKDOWN PROTOCOL
@@ -913,111 +1953,80 @@ async def smack(update: Update, context: ContextTypes.DEFAULT_TYPE):
         target = update.message.reply_to_message.from_user
     elif context.args:
         target_username = context.args[0].strip('@')
-        conn = None
-        cur = None
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT user_id, username FROM pf_users WHERE username = %s OR username = %s",
-                (target_username, f"@{target_username}")
-            )
-            res = cur.fetchone()
-            if res:
-                target = type('User', (object,), {
-                    'id': res[0],
-                    'username': target_username,
-                    'first_name': target_username
-                })
-            else:
-                return await update.message.reply_text(
-                    f"❌ Target @{target_username} not found in the lab database.\n"
-                    f"🎤 *{random_charlie_quote()}*",
-                    parse_mode='Markdown'
-                )
+            res = await find_user_by_name(target_username)
         except Exception as e:
             logger.error(f"Smack Lookup Error: {e}")
-            return await update.message.reply_text("⚠️ Smack lookup jammed.")
-        finally:
-            safe_close(cur, conn)
+            return reply(update.message, "⚠️ Smack lookup jammed.")
+        if res:
+            target = type('User', (object,), {
+                'id': res[0],
+                'username': target_username,
+                'first_name': target_username
+            })
+        else:
+            return reply(update.message,
+                f"❌ Target @{target_username} not found in the lab database.\n"
+                f"🎤 *{random_charlie_quote()}*",
+                parse_mode='Markdown'
+            )
 
     if not target:
-        return await update.message.reply_text(
+        return reply(update.message,
             "🥊 **HOW TO SMACK:**\n1. Reply to a message with `/smack`\n2. Type `/smack @username`\n3. Type `/smack kitchen`\n"
             f"🎤 *{random_charlie_quote()}*",
             parse_mode='Markdown'
         )
 
     if target.id == attacker.id:
-        return await update.message.reply_text(
+        return nag(update.message,
             f"🚫 You cannot smack yourself.\n🎤 *{random_charlie_quote()}*",
             parse_mode='Markdown'
         )
 
+    # taken before a connection, so a queue of smacks on one target never pins the pool;
+    # the kitchen has no smack window or KO row, so smacks on it need no lock
+    target_lock = None if kitchen_target else target.id
+    if target_lock is not None:
+        await SMACK_TARGET_LOCKS.acquire(target_lock)
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
 
-        ensure_user_record(cur, attacker)
-        ensure_user_id_record(cur, target.id, target.username or target.first_name or "Unknown")
+        await ensure_user_record(cur, attacker)
+        await ensure_user_id_record(cur, target.id, target.username or target.first_name or "Unknown")
 
-        cur.execute("SELECT daily_calories FROM pf_users WHERE user_id = %s", (attacker.id,))
+        await cur.execute("SELECT daily_calories FROM pf_user_counters WHERE user_id = %s", (attacker.id,))
         a_res = cur.fetchone()
-        if not a_res or (a_res[0] or 0) < 200:
-            return await update.message.reply_text(
+        if not a_res or (a_res[0] or 0) + CALORIE_BUFFER.pending_calories(attacker.id, day_epoch()) < 200:
+            return nag(update.message,
                 f"🦴 You are too weak. Smacking costs 200 Cal.\n🎤 *{random_charlie_quote()}*",
                 parse_mode='Markdown'
             )
 
         rage_gain = random.randint(5, 15)
-        cur.execute("""
-            UPDATE pf_users
-            SET daily_calories = daily_calories + %s
-            WHERE user_id = 0
-            RETURNING daily_calories, rampage_until
-        """, (rage_gain,))
-        chef_state = cur.fetchone()
-        chef_rage = chef_state[0] if chef_state and chef_state[0] else 0
-        current_rampage_until = chef_state[1] if chef_state else None
-        await maybe_announce_rage(context.bot, cur, conn, chef_rage)
 
         if kitchen_target:
+            chef_rage = KITCHEN.add_rage(rage_gain)
+            await maybe_announce_rage(context.bot, chef_rage)
+
             kitchen_heat_gain = random.randint(5, 25)
             kitchen_bonus_rage = 15
 
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_calories = GREATEST(0, daily_calories - 2000),
-                    total_calories = GREATEST(0, total_calories - 2000),
-                    heat_level = heat_level + %s
-                WHERE user_id = %s
-            """, (kitchen_heat_gain, attacker.id))
+            attacker_totals = await apply_calorie_delta(cur, attacker.id, -2000, kitchen_heat_gain, "smack_back", now)
 
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_calories = daily_calories + %s
-                WHERE user_id = 0
-                RETURNING daily_calories, rampage_until
-            """, (kitchen_bonus_rage,))
-            chef_state = cur.fetchone()
-            chef_rage = chef_state[0] if chef_state and chef_state[0] else 0
-            current_rampage_until = chef_state[1] if chef_state else None
-            await maybe_announce_rage(context.bot, cur, conn, chef_rage)
-
-            if chef_rage >= 100 and not rampage_active_until(current_rampage_until, now):
-                new_rampage_until = now + timedelta(hours=1)
-                cur.execute("""
-                    UPDATE pf_users
-                    SET rampage_until = %s,
-                        last_rampage_reminder_at = NULL,
-                        rampage_end_announced_for = NULL
-                    WHERE user_id = 0
-                """, (new_rampage_until,))
-                current_rampage_until = new_rampage_until
+            chef_rage = KITCHEN.add_rage(kitchen_bonus_rage)
+            await maybe_announce_rage(context.bot, chef_rage)
 
-            conn.commit()
+            current_rampage_until = KITCHEN.rampage_until
+            if chef_rage >= 100:
+                current_rampage_until = KITCHEN.start_rampage(now)
+
+            await conn.commit()
+            track_calorie_change(attacker.id, attacker_totals)
+            wake_kitchen_for_heat(context.job_queue, current_rampage_until, now)
 
             msg = (
                 f"👨‍🍳 **CHEF SMACK-BACK!** You slapped the kitchen and got folded.\n"
@@ -1029,62 +2038,62 @@ async def smack(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 mins_left = max(1, int((current_rampage_until - now).total_seconds() // 60))
                 msg += f"🔥 **CHEF RAMPAGE LIVE:** {mins_left}m left.\n"
             msg += f"🎤 *{random_charlie_quote()}*"
-            return await update.message.reply_text(msg, parse_mode='Markdown')
+            return reply(update.message, msg, parse_mode='Markdown')
 
-        cur.execute("""
-            SELECT smack_count, last_smack_time, smack_ids, daily_ko_count, last_ko_time
-            FROM pf_users
+        await cur.execute("""
+            SELECT daily_ko_count, last_ko_time
+            FROM pf_user_counters
             WHERE user_id = %s
         """, (target.id,))
         t_data = cur.fetchone()
-        s_count, l_smack, s_ids, ko_count, l_ko = t_data if t_data else (0, None, "", 0, None)
+        ko_count, l_ko = t_data if t_data else (0, None)
 
-        if l_smack and now - l_smack > timedelta(minutes=15):
-            s_count, s_ids = 0, ""
+        await cur.execute("""
+            SELECT attacker_id, smacked_at
+            FROM pf_smack_window
+            WHERE target_id = %s
+        """, (target.id,))
+        window = dict(cur.fetchall())
+        # the window closes 15 minutes after its latest smack
+        window_stale = bool(window) and now - max(window.values()) > SMACK_WINDOW
+        if window_stale:
+            window = {}
 
         if l_ko and now - l_ko < timedelta(hours=6):
             rem = timedelta(hours=6) - (now - l_ko)
-            return await update.message.reply_text(
+            return nag(update.message,
                 f"🛡️ Target is in recovery. Immune for {int(rem.total_seconds()//60)}m.\n"
                 f"🎤 *{random_charlie_quote()}*",
                 parse_mode='Markdown'
             )
 
         if ko_count >= 2:
-            return await update.message.reply_text(
+            return nag(update.message,
                 f"🛡️ Target has reached the daily limit of knockouts.\n🎤 *{random_charlie_quote()}*",
                 parse_mode='Markdown'
             )
 
-        s_list = s_ids.split(",") if s_ids else []
-        if str(attacker.id) in s_list:
-            return await update.message.reply_text(
+        if attacker.id in window:
+            return nag(update.message,
                 f"🚫 You already smacked this user in this window!\n🎤 *{random_charlie_quote()}*",
                 parse_mode='Markdown'
             )
 
-        if chef_rage >= 100 and not rampage_active_until(current_rampage_until, now):
-            new_rampage_until = now + timedelta(hours=1)
-            cur.execute("""
-                UPDATE pf_users
-                SET rampage_until = %s,
-                    last_rampage_reminder_at = NULL,
-                    rampage_end_announced_for = NULL
-                WHERE user_id = 0
-            """, (new_rampage_until,))
-            current_rampage_until = new_rampage_until
+        # rage only counts once the smack is known to land
+        chef_rage = KITCHEN.add_rage(rage_gain)
+        await maybe_announce_rage(context.bot, chef_rage)
+
+        current_rampage_until = KITCHEN.rampage_until
+        if chef_rage >= 100:
+            current_rampage_until = KITCHEN.start_rampage(now)
 
         if chef_rage > 50 and random.random() < 0.30:
             counter_heat_gain = random.randint(5, 25)
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_calories = GREATEST(0, daily_calories - 1500),
-                    total_calories = GREATEST(0, total_calories - 1500),
-                    heat_level = heat_level + %s
-                WHERE user_id = %s
-            """, (counter_heat_gain, attacker.id))
-            conn.commit()
-            return await update.message.reply_text(
+            attacker_totals = await apply_calorie_delta(cur, attacker.id, -1500, counter_heat_gain, "counter_slap", now)
+            await conn.commit()
+            track_calorie_change(attacker.id, attacker_totals)
+            wake_kitchen_for_heat(context.job_queue, current_rampage_until, now)
+            return reply(update.message,
                 f"👨‍🍳 **COUNTER-SLAP!** The Chef wasn't having it.\n"
                 f"💥 **-1,500 Cal**\n"
                 f"🌡️ **Heat +{counter_heat_gain}**\n"
@@ -1092,42 +2101,40 @@ async def smack(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode='Markdown'
             )
 
-        s_count += 1
-        s_list.append(str(attacker.id))
-        new_s_ids = ",".join(s_list)
+        s_count = len(window) + 1
         smack_heat_gain = random.randint(5, 25)
 
-        cur.execute("""
-            UPDATE pf_users
-            SET daily_calories = GREATEST(0, daily_calories - 200),
-                total_calories = GREATEST(0, total_calories - 200),
-                heat_level = heat_level + %s
-            WHERE user_id = %s
-        """, (smack_heat_gain, attacker.id))
+        attacker_totals = await apply_calorie_delta(cur, attacker.id, -200, smack_heat_gain, "smack_cost", now)
+        target_totals = None
+
+        if window_stale or s_count >= 5:
+            await cur.execute("DELETE FROM pf_smack_window WHERE target_id = %s", (target.id,))
 
         if s_count >= 5:
-            cur.execute("""
-                UPDATE pf_users
-                SET daily_calories = GREATEST(0, daily_calories - 2500),
-                    total_calories = GREATEST(0, total_calories - 2500),
-                    smack_count = 0,
-                    smack_ids = '',
-                    daily_ko_count = daily_ko_count + 1,
+            await cur.execute("""
+                WITH old AS (SELECT daily_calories FROM pf_user_counters WHERE user_id = %s FOR UPDATE)
+                UPDATE pf_user_counters u
+                SET daily_calories = GREATEST(0, u.daily_calories - 2500),
+                    total_calories = GREATEST(0, u.total_calories - 2500),
+                    daily_ko_count = u.daily_ko_count + 1,
                     last_ko_time = %s
-                WHERE user_id = %s
-            """, (now, target.id))
+                FROM old
+                WHERE u.user_id = %s
+                RETURNING u.total_calories, u.daily_calories, u.daily_calories - old.daily_calories
+            """, (target.id, now, target.id))
+            ko_row = cur.fetchone()
+            if ko_row:
+                target_totals, ko_delta = ko_row[:2], ko_row[2]
             msg = (
                 f"💥 **K.O.!** @{escape_name(target.username or target.first_name)} was jumped! **-2,500 Cal** shed.\n"
                 f"🛡️ Recovery active (6 Hours).\n"
             )
         else:
-            cur.execute("""
-                UPDATE pf_users
-                SET smack_count = %s,
-                    last_smack_time = %s,
-                    smack_ids = %s
-                WHERE user_id = %s
-            """, (s_count, now, new_s_ids, target.id))
+            await cur.execute("""
+                INSERT INTO pf_smack_window (target_id, attacker_id, smacked_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (target_id, attacker_id) DO UPDATE SET smacked_at = EXCLUDED.smacked_at
+            """, (target.id, attacker.id, now))
             bar = "🟥" * s_count + "⬜" * (5 - s_count)
             msg = (
                 f"🥊 **SMACKED!** @{escape_name(target.username or target.first_name)}\n"
@@ -1141,16 +2148,23 @@ async def smack(update: Update, context: ContextTypes.DEFAULT_TYPE):
             msg += f"🔥 **CHEF RAMPAGE LIVE:** {mins_left}m left.\n"
 
         msg += f"🎤 *{random_charlie_quote()}*"
-        await update.message.reply_text(msg, parse_mode='Markdown')
-
-        conn.commit()
+        reply(update.message, msg, parse_mode='Markdown')
+
+        await conn.commit()
+        track_calorie_change(attacker.id, attacker_totals)
+        wake_kitchen_for_heat(context.job_queue, current_rampage_until, now)
+        if target_totals:
+            track_calorie_change(target.id, target_totals)
+            record_event(target.id, "knockout", ko_delta, now)
     except Exception as e:
         if conn:
-            conn.rollback()
+            await conn.rollback()
         logger.error(f"Smack Error: {e}")
-        await update.message.reply_text("⚠️ Smack system jammed.")
+        reply(update.message, "⚠️ Smack system jammed.")
     finally:
         safe_close(cur, conn)
+        if target_lock is not None:
+            SMACK_TARGET_LOCKS.release(target_lock)
 
 # ==========================================
 # 7. GIFTING
@@ -1158,27 +2172,23 @@ async def smack(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     sender, now = update.effective_user, datetime.utcnow()
     receiver = None
+    content = CONTENT  # one snapshot for the whole handler, even across a reload
+
+    held = COOLDOWNS.check("gift", sender.id, now)
+    if held:
+        return nag(update.message, f"⏳ **COOLDOWN:** {held[0] // 60}m remaining.")
 
     conn = None
     cur = None
+    dock_id = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        ensure_user_record(cur, sender)
-
         # 1) Direct gifting via /gift @username
         if context.args:
             target_username = context.args[0].strip().lstrip("@")
-            cur.execute("""
-                SELECT user_id, username
-                FROM pf_users
-                WHERE LOWER(username) = LOWER(%s) OR LOWER(username) = LOWER(%s)
-                LIMIT 1
-            """, (target_username, f"@{target_username}"))
-            row = cur.fetchone()
+            row = await find_user_by_name(target_username)
 
             if not row:
-                return await update.message.reply_text(
+                return reply(update.message,
                     f"❌ @{target_username} not found in the lab database."
                 )
 
@@ -1191,124 +2201,125 @@ async def gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 2) Fallback to reply gifting
         elif update.message.reply_to_message:
             receiver = update.message.reply_to_message.from_user
-            ensure_user_record(cur, receiver)
 
         # 3) Neither provided
         else:
-            return await update.message.reply_text(
+            return reply(update.message,
                 "💡 Use `/gift @username` or reply to a message with `/gift`.",
                 parse_mode='Markdown'
             )
 
         if receiver.id == sender.id:
-            return await update.message.reply_text("🚫 Self-gifting is prohibited.")
+            return nag(update.message, "🚫 Self-gifting is prohibited.")
+
+        # two senders must not both find the dock empty; taken before a connection,
+        # so a burst of gifts to one receiver never pins the pool
+        if receiver.id != context.bot.id:
+            await DOCK_LOCKS.acquire(receiver.id)
+            dock_id = receiver.id
+
+        conn = await db_connect()
+        cur = conn.cursor()
+        await ensure_user_record(cur, sender)
+        if update.message.reply_to_message and not context.args:
+            await ensure_user_record(cur, receiver)
 
         is_golden_hour = now.hour == 0
         cooldown_minutes = 20 if is_founder(sender) else 60
 
-        cur.execute("SELECT last_gift_sent FROM pf_users WHERE user_id = %s", (sender.id,))
+        await cur.execute("SELECT last_gift_sent FROM pf_user_cooldowns WHERE user_id = %s", (sender.id,))
         res = cur.fetchone()
         if res and res[0] and now - res[0] < timedelta(minutes=cooldown_minutes):
+            COOLDOWNS.hold("gift", sender.id, res[0] + timedelta(minutes=cooldown_minutes))
             rem = timedelta(minutes=cooldown_minutes) - (now - res[0])
-            return await update.message.reply_text(f"⏳ **COOLDOWN:** {int(rem.total_seconds()//60)}m remaining.")
+            return nag(update.message, f"⏳ **COOLDOWN:** {int(rem.total_seconds()//60)}m remaining.")
 
         if receiver.id == context.bot.id:
-            cur.execute("UPDATE pf_users SET last_gift_sent = %s WHERE user_id = %s", (now, sender.id))
+            await stamp_cooldown(cur, "last_gift_sent", sender.id, now)
+            COOLDOWNS.hold("gift", sender.id, now + timedelta(minutes=cooldown_minutes))
             outcome = random.choices([1, 2, 3], weights=[30, 40, 30], k=1)[0]
 
             if outcome == 1:
                 penalty = 1500
-                cur.execute("""
-                    UPDATE pf_users
-                    SET daily_calories = GREATEST(0, daily_calories - %s),
-                        total_calories = GREATEST(0, total_calories - %s)
-                    WHERE user_id = %s
-                """, (penalty, penalty, sender.id))
-                conn.commit()
-                return await update.message.reply_text(f"💀 **REFLECTED!** Toxin bounced back. **-{penalty:,} Cal**.")
+                sender_totals = await apply_calorie_delta(cur, sender.id, -penalty, kind="gift_reflect", now=now)
+                await conn.commit()
+                track_calorie_change(sender.id, sender_totals)
+                return reply(update.message, f"💀 **REFLECTED!** Toxin bounced back. **-{penalty:,} Cal**.")
             elif outcome == 2:
-                conn.commit()
-                return await update.message.reply_text("😋 **OM NOM NOM...** The Chef devours it.")
+                await conn.commit()
+                return reply(update.message, "😋 **OM NOM NOM...** The Chef devours it.")
             else:
-                item = random.choice(foods)
-                cur.execute("""
-                    UPDATE pf_users
-                    SET total_calories = total_calories + %s
-                    WHERE user_id = 0
-                    RETURNING total_calories
-                """, (item.get('calories', 500),))
-                cur_val = cur.fetchone()[0]
+                item = content.foods.draw()
+                cur_val = KITCHEN.add_to_meter(item.calories)
 
                 if cur_val >= METER_GOAL:
                     jackpot = random.randint(10000, 20000)
-                    cur.execute("UPDATE pf_users SET total_calories = 0 WHERE user_id = 0")
-                    cur.execute("""
-                        UPDATE pf_users
-                        SET daily_calories = daily_calories + %s,
-                            total_calories = total_calories + %s
-                        WHERE user_id = %s
-                    """, (jackpot, jackpot, sender.id))
-                    conn.commit()
-                    return await update.message.reply_text(
+                    KITCHEN.reset_meter()
+                    sender_totals = await apply_calorie_delta(cur, sender.id, jackpot, kind="gift_jackpot", now=now)
+                    await conn.commit()
+                    track_calorie_change(sender.id, sender_totals)
+                    return reply(update.message,
                         f"💥 **KITCHEN OVERLOAD!** 🏆 @{escape_name(sender.username or sender.first_name)}: **+{jackpot:,} Cal**",
                         parse_mode='Markdown'
                     )
 
-                conn.commit()
-                return await update.message.reply_text(f"✅ **CHEF FED.**\n{get_progress_bar(cur_val)}")
+                await conn.commit()
+                return reply(update.message, f"✅ **CHEF FED.**\n{get_progress_bar(cur_val)}")
 
-        ensure_user_id_record(cur, receiver.id, receiver.username or receiver.first_name or "Unknown")
+        await ensure_user_id_record(cur, receiver.id, receiver.username or receiver.first_name or "Unknown")
 
-        cur.execute("SELECT id FROM pf_gifts WHERE receiver_id = %s AND is_opened = FALSE", (receiver.id,))
+        await cur.execute("SELECT id FROM pf_gifts WHERE receiver_id = %s AND is_opened = FALSE", (receiver.id,))
         if cur.fetchone():
-            return await update.message.reply_text("📦 **DOCK BLOCKED:** Shipment pending. Cooldown saved.")
+            return reply(update.message, "📦 **DOCK BLOCKED:** Shipment pending. Cooldown saved.")
 
-        cur.execute("UPDATE pf_users SET last_gift_sent = %s WHERE user_id = %s", (now, sender.id))
+        await stamp_cooldown(cur, "last_gift_sent", sender.id, now)
+        COOLDOWNS.hold("gift", sender.id, now + timedelta(minutes=cooldown_minutes))
 
         gh_tag = ""
         if is_golden_hour:
             gh_tag = "🌟 **GOLDEN HOUR:** 100% Protein Active!\n"
-            item = random.choice(foods)
-            val = abs(item.get('calories', 500))
+            item = content.foods.draw()
+            item_name, val = item.name, abs(item.calories)
             i_type = "PROTEIN"
             msg = "Golden Hour Nutrition!"
         else:
             is_p = random.choice([True, False])
 
             if is_p:
-                curse = roll_punishment()
+                curse = roll_punishment(content)
 
                 if curse:
-                    item = {"name": curse["name"]}
+                    item_name = curse["name"]
                     val = curse["value"]
                     i_type = "CURSED"
                     msg = curse["text"]
                 else:
-                    item = random.choice(hacks) if hacks else {"name": "Experimental Sludge", "blueprint": "Something went wrong."}
+                    item = content.hacks.draw() if content.hacks else Hack(None, "Experimental Sludge", blueprint="Something went wrong.")
+                    item_name = item.name
                     val = random.randint(-2500, -800)
                     i_type = "POISON"
-                    msg = f"Toxin Level: {item.get('blueprint', 'Experimental Sludge.')}"
+                    msg = f"Toxin Level: {item.blueprint or 'Experimental Sludge.'}"
             else:
-                item = random.choice(foods)
-                val = item.get('calories', 500)
+                item = content.foods.draw()
+                item_name, val = item.name, item.calories
                 i_type = "PROTEIN"
                 msg = "Incoming Delivery!"
 
-        cur.execute("""
+        await cur.execute("""
             INSERT INTO pf_gifts (sender_id, sender_name, receiver_id, item_name, item_type, value, flavor_text)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         """, (
             sender.id,
             sender.first_name,
             receiver.id,
-            item['name'],
+            item_name,
             i_type,
             val,
             msg
         ))
 
-        conn.commit()
-        await update.message.reply_text(
+        await conn.commit()
+        reply(update.message,
             f"{gh_tag}📦 MYSTERY SHIPMENT DROPPED!\n"
             f"@{receiver.username or receiver.first_name}, choose your fate:\n"
             f"/open\n"
@@ -1318,11 +2329,14 @@ async def gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     except Exception as e:
         if conn:
-            conn.rollback()
+            await conn.rollback()
+        COOLDOWNS.forget("gift", sender.id)
         logger.error(f"Gift Error: {e}")
-        await update.message.reply_text("⚠️ Kitchen glitch.")
+        reply(update.message, "⚠️ Kitchen glitch.")
     finally:
         safe_close(cur, conn)
+        if dock_id is not None:
+            DOCK_LOCKS.release(dock_id)
 
 async def open_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -1330,11 +2344,11 @@ async def open_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
-        ensure_user_record(cur, user)
+        await ensure_user_record(cur, user)
 
-        cur.execute("""
+        await cur.execute("""
             SELECT id, sender_name, item_name, item_type, value, sender_id
             FROM pf_gifts
             WHERE receiver_id = %s AND is_opened = FALSE
@@ -1344,23 +2358,27 @@ async def open_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
         row = cur.fetchone()
 
         if not row:
-            return await update.message.reply_text("📦 Your dock is empty.")
+            return reply(update.message, "📦 Your dock is empty.")
 
         g_id, s_name, i_name, i_type, val, s_id = row
 
-        cur.execute("UPDATE pf_gifts SET is_opened = TRUE WHERE id = %s", (g_id,))
-        cur.execute("""
-            UPDATE pf_users
+        await cur.execute("UPDATE pf_gifts SET is_opened = TRUE WHERE id = %s", (g_id,))
+        await cur.execute("""
+            UPDATE pf_user_counters
             SET daily_calories = daily_calories + %s,
                 total_calories = GREATEST(0, total_calories + %s)
             WHERE user_id = %s
+            RETURNING total_calories, daily_calories
         """, (val, val, user_id))
+        receiver_totals = cur.fetchone()
 
-        ensure_user_id_record(cur, s_id, s_name or "Unknown")
+        await ensure_user_id_record(cur, s_id, s_name or "Unknown")
         col = "gifts_sent_val" if i_type == "PROTEIN" else "sabotage_val"
-        cur.execute(f"UPDATE pf_users SET {col} = {col} + %s WHERE user_id = %s", (abs(val), s_id))
+        await cur.execute(f"UPDATE pf_users SET {col} = {col} + %s WHERE user_id = %s", (abs(val), s_id))
 
-        conn.commit()
+        await conn.commit()
+        track_calorie_change(user_id, receiver_totals)
+        record_event(user_id, "gift_open", val)
 
         sign = "+" if val > 0 else ""
         if i_type == "PROTEIN":
@@ -1370,16 +2388,16 @@ async def open_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             header = "💀 **TOXIN DETECTED!**"
 
-        await update.message.reply_text(
+        reply(update.message,
             f"{header}\nFrom **{escape_name(s_name)}**: {i_name}\n📊 Impact: {sign}{val:,} Cal",
             parse_mode='Markdown'
         )
 
     except Exception as e:
         if conn:
-            conn.rollback()
+            await conn.rollback()
         logger.error(f"Open Gift Error: {e}")
-        await update.message.reply_text(f"⚠️ Error: {e}")
+        reply(update.message, f"⚠️ Error: {e}")
     finally:
         safe_close(cur, conn)
 
@@ -1389,23 +2407,30 @@ async def trash_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
-        ensure_user_record(cur, user)
-
-        cur.execute("UPDATE pf_gifts SET is_opened = TRUE WHERE receiver_id = %s AND is_opened = FALSE", (user_id,))
-        cur.execute("""
-            UPDATE pf_users
-            SET daily_calories = GREATEST(0, daily_calories - 100)
-            WHERE user_id = %s
-        """, (user_id,))
-        conn.commit()
-        await update.message.reply_text("🚮 **SCRAPPED:** Paid 100 Cal fee.")
+        await ensure_user_record(cur, user)
+
+        await cur.execute("UPDATE pf_gifts SET is_opened = TRUE WHERE receiver_id = %s AND is_opened = FALSE", (user_id,))
+        await cur.execute("""
+            WITH old AS (SELECT daily_calories FROM pf_user_counters WHERE user_id = %s FOR UPDATE)
+            UPDATE pf_user_counters u
+            SET daily_calories = GREATEST(0, u.daily_calories - 100)
+            FROM old
+            WHERE u.user_id = %s
+            RETURNING u.total_calories, u.daily_calories, u.daily_calories - old.daily_calories
+        """, (user_id, user_id))
+        row = cur.fetchone()
+        await conn.commit()
+        track_calorie_change(user_id, row and row[:2])
+        if row:
+            record_event(user_id, "trash", row[2])
+        reply(update.message, "🚮 **SCRAPPED:** Paid 100 Cal fee.")
     except Exception as e:
         if conn:
-            conn.rollback()
+            await conn.rollback()
         logger.error(f"Trash Gift Error: {e}")
-        await update.message.reply_text("⚠️ Trash chute jammed.")
+        reply(update.message, "⚠️ Trash chute jammed.")
     finally:
         safe_close(cur, conn)
 
@@ -1417,25 +2442,42 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
 
-        cur.execute("""
-            SELECT total_calories, daily_calories, CAST(daily_clog AS FLOAT), is_icu, icu_lifetime,
-                   daily_ko_count, last_ko_time, lifetime_daily_wins, lifetime_hack_wins, heat_level
-            FROM pf_users
-            WHERE user_id = %s
-        """, (user.id,))
+        # read-only: a row still on an older day shows as rolled over without being written
+        epoch = day_epoch()
+        await cur.execute("""
+            SELECT c.total_calories,
+                   CASE WHEN c.day_epoch = %s THEN c.daily_calories ELSE 0 END,
+                   CASE WHEN c.day_epoch = %s THEN CAST(c.daily_clog AS FLOAT) ELSE 0 END,
+                   c.day_epoch = %s AND c.is_icu,
+                   u.icu_lifetime,
+                   CASE WHEN c.day_epoch = %s THEN c.daily_ko_count ELSE 0 END,
+                   c.last_ko_time, u.lifetime_daily_wins, u.lifetime_hack_wins,
+                   CASE WHEN c.day_epoch = %s THEN c.heat_level ELSE 0 END
+            FROM pf_users u
+            JOIN pf_user_counters c ON c.user_id = u.user_id
+            WHERE u.user_id = %s
+        """, (epoch, epoch, epoch, epoch, epoch, user.id))
         u = cur.fetchone()
 
-        cur.execute("SELECT total_calories, daily_calories, rampage_until FROM pf_users WHERE user_id = 0")
-        kitchen_row = cur.fetchone()
-        meter_val = kitchen_row[0] if kitchen_row else 0
-        rage_val = kitchen_row[1] if kitchen_row else 0
-        rampage_until_val = kitchen_row[2] if kitchen_row else None
+        meter_val = KITCHEN.meter
+        rage_val = KITCHEN.rage
+        rampage_until_val = KITCHEN.rampage_until
 
         if not u:
-            return await update.message.reply_text("❌ No records.")
+            return reply(update.message, "❌ No records.")
+
+        # The row just read is authoritative, so it also corrects any drift in the rank index
+        RANKS.update(user.id, total_calories=u[0], daily_calories=u[1], daily_clog=u[2], icu_lifetime=u[4])
+        rank_text = ""
+        girth_rank = RANKS.rank("total_calories", user.id)
+        if girth_rank:
+            rank_text = (
+                f"🏅 Girth Rank: #{girth_rank[0]:,} of {girth_rank[1]:,} "
+                f"(Top {RANKS.top_percent('total_calories', user.id)}%)\n"
+            )
 
         now = datetime.utcnow()
         p_status = "🟢 VULNERABLE"
@@ -1464,206 +2506,293 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg = (
             f"📋 *VITALS: @{escape_name(user.first_name)}*\n━━━━━━━━━━━━━━\n"
             f"🧬 Status: {'🚨 ICU' if u[3] else '🟢 STABLE'}\n"
-            f"💀 ICU Visits: {u[4]} ({get_icu_rank(u[4])})\n"
-            f"🔥 Daily: {u[1]:,} Cal\n"
-            f"📈 Total: {u[0]:,} Cal\n"
-            f"🩸 Clog: {u[2]:.1f}%\n"
+            f"💀 ICU Visits: {u[4]} ({get_icu_rank(u[4])}){format_rank('icu_lifetime', user.id)}\n"
+            f"🔥 Daily: {u[1]:,} Cal{format_rank('daily_calories', user.id)}\n"
+            f"📈 Total: {u[0]:,} Cal{format_rank('total_calories', user.id)}\n"
+            f"🩸 Clog: {u[2]:.1f}%{format_rank('daily_clog', user.id)}\n"
+            f"{rank_text}"
             f"🌡️ Heat: {u[9]}\n"
             f"🥊 Smack Status: {p_status}\n\n"
             f"🏆 **CHAMPIONSHIPS:**\n{title_display}\n━━━━━━━━━━━━━━\n"
             f"👨‍🍳 **KITCHEN SATIETY:**\n{get_progress_bar(meter_val)}\n"
             f"🔥 **CHEF RAGE:** {rage_val}/100{rampage_text}"
         )
-        await update.message.reply_text(msg, parse_mode='Markdown')
+        reply(update.message, msg, parse_mode='Markdown')
     except Exception as e:
         logger.error(f"Status Error: {e}")
-        await update.message.reply_text("⚠️ Vitals monitor offline.")
+        reply(update.message, "⚠️ Vitals monitor offline.")
     finally:
         safe_close(cur, conn)
 
+async def serve_board(update: Update, board, render):
+    """Replies with a board from the read cache, querying Postgres only on a miss."""
+    rendered = BOARD_CACHE.get(board)
+    if rendered is None:
+        generation = BOARD_CACHE.generation(board)
+        conn = None
+        cur = None
+        try:
+            conn = await db_connect()
+            cur = conn.cursor()
+            rendered = await render(cur)
+        finally:
+            safe_close(cur, conn)
+        BOARD_CACHE.put(board, rendered, generation)
+
+    text, parse_mode = rendered
+    reply(update.message, text, parse_mode=parse_mode)
+
+async def render_halloffame(cur):
+    await cur.execute("""
+        SELECT username, lifetime_daily_wins
+        FROM pf_users
+        WHERE lifetime_daily_wins > 0
+          AND user_id != 0
+          AND COALESCE(leaderboard_enabled, TRUE) = TRUE
+        ORDER BY lifetime_daily_wins DESC
+        LIMIT 10
+    """)
+    phat_winners = cur.fetchall()
+
+    await cur.execute("""
+        SELECT username, lifetime_hack_wins
+        FROM pf_users
+        WHERE lifetime_hack_wins > 0
+          AND user_id != 0
+          AND COALESCE(leaderboard_enabled, TRUE) = TRUE
+        ORDER BY lifetime_hack_wins DESC
+        LIMIT 10
+    """)
+    hack_winners = cur.fetchall()
+
+    text = "🏆 **THE HALL OF ETERNAL GIRTH** 🏆\n━━━━━━━━━━━━━━\n"
+    text += "🍔 **HEAVYWEIGHT CHAMPS**\n"
+    if not phat_winners:
+        text += "No champions yet.\n"
+    for i, r in enumerate(phat_winners):
+        text += f"{i+1}. {escape_name(r[0])}: {r[1]} Wins\n"
+
+    text += "\n🧪 **MASTER ARCHITECTS**\n"
+    if not hack_winners:
+        text += "No champions yet.\n"
+    for i, r in enumerate(hack_winners):
+        text += f"{i+1}. {escape_name(r[0])}: {r[1]} Wins\n"
+    text += "━━━━━━━━━━━━━━"
+    return text, 'Markdown'
+
 async def halloffame(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    conn = None
-    cur = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT username, lifetime_daily_wins
-            FROM pf_users
-            WHERE lifetime_daily_wins > 0
-              AND user_id != 0
-              AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-            ORDER BY lifetime_daily_wins DESC
-            LIMIT 10
-        """)
-        phat_winners = cur.fetchall()
-
-        cur.execute("""
-            SELECT username, lifetime_hack_wins
-            FROM pf_users
-            WHERE lifetime_hack_wins > 0
-              AND user_id != 0
-              AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-            ORDER BY lifetime_hack_wins DESC
-            LIMIT 10
-        """)
-        hack_winners = cur.fetchall()
-
-        text = "🏆 **THE HALL OF ETERNAL GIRTH** 🏆\n━━━━━━━━━━━━━━\n"
-        text += "🍔 **HEAVYWEIGHT CHAMPS**\n"
-        if not phat_winners:
-            text += "No champions yet.\n"
-        for i, r in enumerate(phat_winners):
-            text += f"{i+1}. {escape_name(r[0])}: {r[1]} Wins\n"
-
-        text += "\n🧪 **MASTER ARCHITECTS**\n"
-        if not hack_winners:
-            text += "No champions yet.\n"
-        for i, r in enumerate(hack_winners):
-            text += f"{i+1}. {escape_name(r[0])}: {r[1]} Wins\n"
-        text += "━━━━━━━━━━━━━━"
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await serve_board(update, "halloffame", render_halloffame)
     except Exception as e:
         logger.error(f"Hall of Fame Error: {e}")
-        await update.message.reply_text("⚠️ Hall of Fame offline.")
-    finally:
-        safe_close(cur, conn)
+        reply(update.message, "⚠️ Hall of Fame offline.")
+
+async def render_daily(cur):
+    await cur.execute("""
+        SELECT u.username, c.daily_calories
+        FROM pf_user_counters c
+        JOIN pf_users u ON u.user_id = c.user_id
+        WHERE c.day_epoch = %s
+          AND c.user_id != 0
+          AND c.daily_calories != 0
+          AND COALESCE(u.leaderboard_enabled, TRUE) = TRUE
+        ORDER BY c.daily_calories DESC
+        LIMIT 20
+    """, (day_epoch(),))
+    rows = cur.fetchall()
+    if not rows:
+        return "🍔 **NO MUNCHERS YET.**", None
+    text = "🔥 **DAILY FEEDING FRENZY (TOP 20)** 🔥\n━━━━━━━━━━━━━━\n" + "\n".join(
+        [f"{i+1}. {escape_name(r[0])}: {r[1]:,} Cal" for i, r in enumerate(rows)]
+    )
+    return text, 'Markdown'
 
 async def daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    conn = None
-    cur = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT username, daily_calories
-            FROM pf_users
-            WHERE user_id != 0
-              AND daily_calories != 0
-              AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-            ORDER BY daily_calories DESC
-            LIMIT 20
-        """)
-        rows = cur.fetchall()
-        if not rows:
-            return await update.message.reply_text("🍔 **NO MUNCHERS YET.**")
-        text = "🔥 **DAILY FEEDING FRENZY (TOP 20)** 🔥\n━━━━━━━━━━━━━━\n" + "\n".join(
-            [f"{i+1}. {escape_name(r[0])}: {r[1]:,} Cal" for i, r in enumerate(rows)]
-        )
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await serve_board(update, "daily", render_daily)
     except Exception as e:
         logger.error(f"Daily Error: {e}")
-        await update.message.reply_text("⚠️ Daily board offline.")
-    finally:
-        safe_close(cur, conn)
+        reply(update.message, "⚠️ Daily board offline.")
+
+async def render_leaderboard(cur):
+    await cur.execute("""
+        SELECT u.username, c.total_calories
+        FROM pf_user_counters c
+        JOIN pf_users u ON u.user_id = c.user_id
+        WHERE c.user_id != 0
+          AND COALESCE(u.leaderboard_enabled, TRUE) = TRUE
+        ORDER BY c.total_calories DESC
+        LIMIT 20
+    """)
+    rows = cur.fetchall()
+    text = "🏆 **THE HALL OF INFINITE GIRTH (TOP 20)** 🏆\n━━━━━━━━━━━━━━\n" + "\n".join(
+        [f"{i+1}. {escape_name(r[0])}: {r[1]:,} Cal" for i, r in enumerate(rows)]
+    )
+    return text, 'Markdown'
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    conn = None
-    cur = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT username, total_calories
-            FROM pf_users
-            WHERE user_id != 0
-              AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-            ORDER BY total_calories DESC
-            LIMIT 20
-        """)
-        rows = cur.fetchall()
-        text = "🏆 **THE HALL OF INFINITE GIRTH (TOP 20)** 🏆\n━━━━━━━━━━━━━━\n" + "\n".join(
-            [f"{i+1}. {escape_name(r[0])}: {r[1]:,} Cal" for i, r in enumerate(rows)]
-        )
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await serve_board(update, "leaderboard", render_leaderboard)
     except Exception as e:
         logger.error(f"Leaderboard Error: {e}")
-        await update.message.reply_text("⚠️ Leaderboard offline.")
-    finally:
-        safe_close(cur, conn)
+        reply(update.message, "⚠️ Leaderboard offline.")
+
+async def render_clogboard(cur):
+    await cur.execute("""
+        SELECT u.username, CAST(c.daily_clog AS FLOAT)
+        FROM pf_user_counters c
+        JOIN pf_users u ON u.user_id = c.user_id
+        WHERE c.day_epoch = %s
+          AND c.user_id != 0
+          AND c.daily_clog > 0
+          AND COALESCE(u.leaderboard_enabled, TRUE) = TRUE
+        ORDER BY c.daily_clog DESC
+        LIMIT 20
+    """, (day_epoch(),))
+    rows = cur.fetchall()
+    if not rows:
+        return "🧪 **THE LAB IS CLEAN.**", None
+    text = "🧪 **LIVE LAB RESULTS (CURRENT CLOG %)** 🧪\n━━━━━━━━━━━━━━\n" + "\n".join(
+        [f"{i+1}. {escape_name(r[0])}: {r[1]:.1f}%" for i, r in enumerate(rows)]
+    )
+    return text, 'Markdown'
 
 async def clogboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    conn = None
-    cur = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT username, CAST(daily_clog AS FLOAT)
-            FROM pf_users
-            WHERE user_id != 0
-              AND daily_clog > 0
-              AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-            ORDER BY daily_clog DESC
-            LIMIT 20
-        """)
-        rows = cur.fetchall()
-        if not rows:
-            return await update.message.reply_text("🧪 **THE LAB IS CLEAN.**")
-        text = "🧪 **LIVE LAB RESULTS (CURRENT CLOG %)** 🧪\n━━━━━━━━━━━━━━\n" + "\n".join(
-            [f"{i+1}. {escape_name(r[0])}: {r[1]:.1f}%" for i, r in enumerate(rows)]
-        )
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await serve_board(update, "clogboard", render_clogboard)
     except Exception as e:
         logger.error(f"Clogboard Error: {e}")
-        await update.message.reply_text("⚠️ Clogboard offline.")
-    finally:
-        safe_close(cur, conn)
+        reply(update.message, "⚠️ Clogboard offline.")
+
+async def render_deaths(cur):
+    await cur.execute("""
+        SELECT username, icu_lifetime
+        FROM pf_users
+        WHERE user_id != 0
+          AND icu_lifetime > 0
+          AND COALESCE(leaderboard_enabled, TRUE) = TRUE
+        ORDER BY icu_lifetime DESC
+        LIMIT 20
+    """)
+    rows = cur.fetchall()
+    if not rows:
+        return "💀 **NO DEATHS LOGGED.**", None
+    text = "💀 **CARDIAC IMMORTALS (LIFETIME DEATHS)** 💀\n━━━━━━━━━━━━━━\n" + "\n".join(
+        [f"{i+1}. {escape_name(r[0])}: {r[1]} ICU Trips" for i, r in enumerate(rows)]
+    )
+    return text, 'Markdown'
 
 async def deaths(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await serve_board(update, "deaths", render_deaths)
+    except Exception as e:
+        logger.error(f"Deaths Error: {e}")
+        reply(update.message, "⚠️ Death ledger offline.")
+
+async def render_weekly(cur):
+    await cur.execute("""
+        SELECT u.username, SUM(d.delta) AS net
+        FROM pf_event_days d
+        JOIN pf_users u ON u.user_id = d.user_id
+        WHERE d.day_epoch > %s
+          AND u.user_id != 0
+          AND COALESCE(u.leaderboard_enabled, TRUE) = TRUE
+        GROUP BY u.user_id, u.username
+        HAVING SUM(d.delta) > 0
+        ORDER BY net DESC
+        LIMIT 20
+    """, (day_epoch() - 7,))
+    rows = cur.fetchall()
+    if not rows:
+        return "📅 **QUIET WEEK.** Nobody gained a thing.", None
+    text = "📅 **WEEKLY GAINERS (LAST 7 DAYS)** 📅\n━━━━━━━━━━━━━━\n" + "\n".join(
+        [f"{i+1}. {escape_name(r[0])}: +{int(r[1]):,} Cal" for i, r in enumerate(rows)]
+    )
+    return text, 'Markdown'
+
+async def weekly(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await serve_board(update, "weekly", render_weekly)
+    except Exception as e:
+        logger.error(f"Weekly Error: {e}")
+        reply(update.message, "⚠️ Weekly board offline.")
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    current = day_epoch()
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT username, icu_lifetime
-            FROM pf_users
-            WHERE user_id != 0
-              AND icu_lifetime > 0
-              AND COALESCE(leaderboard_enabled, TRUE) = TRUE
-            ORDER BY icu_lifetime DESC
-            LIMIT 20
-        """)
-        rows = cur.fetchall()
-        if not rows:
-            return await update.message.reply_text("💀 **NO DEATHS LOGGED.**")
-        text = "💀 **CARDIAC IMMORTALS (LIFETIME DEATHS)** 💀\n━━━━━━━━━━━━━━\n" + "\n".join(
-            [f"{i+1}. {escape_name(r[0])}: {r[1]} ICU Trips" for i, r in enumerate(rows)]
-        )
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await cur.execute("""
+            SELECT day_epoch, SUM(delta), SUM(events)
+            FROM pf_event_days
+            WHERE user_id = %s AND day_epoch > %s
+            GROUP BY day_epoch
+        """, (user.id, current - 7))
+        days = {r[0]: (int(r[1]), int(r[2])) for r in cur.fetchall()}
     except Exception as e:
-        logger.error(f"Deaths Error: {e}")
-        await update.message.reply_text("⚠️ Death ledger offline.")
+        logger.error(f"History Error: {e}")
+        return reply(update.message, "⚠️ History archive offline.")
     finally:
         safe_close(cur, conn)
 
+    if not days:
+        return reply(update.message, "📜 No calorie history in the last 7 days.")
+
+    text = f"📜 **7-DAY INTAKE: {escape_name(user.username or user.first_name)}**\n━━━━━━━━━━━━━━\n"
+    for epoch in range(current, current - 7, -1):
+        net, events = days.get(epoch, (0, 0))
+        sign = "+" if net > 0 else ""
+        text += f"{epoch_start(epoch):%a %d %b}: {sign}{net:,} Cal ({events} moves)\n"
+    text += f"━━━━━━━━━━━━━━\n📊 Week: {sum(d[0] for d in days.values()):+,} Cal"
+    reply(update.message, text, parse_mode='Markdown')
+
 # ==========================================
 # 9. PHAT PFP GENERATOR
 # ==========================================
 async def phatme(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not phat_processor:
-        return await update.message.reply_text("❌ Laboratory offline. (phat_engine.py missing)")
+        return reply(update.message, "❌ Laboratory offline. (phat_engine.py missing)")
 
     user, now = update.effective_user, datetime.utcnow()
+    held = COOLDOWNS.check("phatme", user.id, now)
+    if held:
+        return nag(update.message, f"⌛️ **LAB RECHARGING:** Try again in {held[0] // 3600}h.")
+
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
-        ensure_user_record(cur, user)
-
-        cur.execute("SELECT last_pfp_gen FROM pf_users WHERE user_id = %s", (user.id,))
+        await ensure_user_record(cur, user)
+        await cur.execute("SELECT last_pfp_gen FROM pf_user_cooldowns WHERE user_id = %s", (user.id,))
         res = cur.fetchone()
-        if res and res[0] and now - res[0] < timedelta(hours=24):
-            rem = timedelta(hours=24) - (now - res[0])
-            return await update.message.reply_text(f"⌛️ **LAB RECHARGING:** Try again in {int(rem.total_seconds()//3600)}h.")
+        await conn.commit()
+    except Exception as e:
+        if conn:
+            await conn.rollback()
+        logger.error(f"PhatMe Error: {e}")
+        return reply(update.message, "❌ Kitchen Connection Lost.")
+    finally:
+        safe_close(cur, conn)
 
+    if res and res[0] and now - res[0] < timedelta(hours=24):
+        COOLDOWNS.hold("phatme", user.id, res[0] + timedelta(hours=24))
+        rem = timedelta(hours=24) - (now - res[0])
+        return nag(update.message, f"⌛️ **LAB RECHARGING:** Try again in {int(rem.total_seconds()//3600)}h.")
+
+    # no connection is held across the Telegram calls and the image work;
+    # the cooldown is stamped on a fresh one once there is a result
+    conn = None
+    cur = None
+    try:
         photos = await context.bot.get_user_profile_photos(user.id)
         if not photos.photos:
-            return await update.message.reply_text("❌ No profile picture.")
+            return reply(update.message, "❌ No profile picture.")
 
-        status_msg = await update.message.reply_text("🧪 Synthesizing DNA...")
+        status_msg = await reply(update.message, "🧪 Synthesizing DNA...")
         file_id = photos.photos[0][-1].file_id
         file = await context.bot.get_file(file_id)
         photo_bytes = await file.download_as_bytearray()
@@ -1672,22 +2801,26 @@ async def phatme(update: Update, context: ContextTypes.DEFAULT_TYPE):
         result_img_bytes = await task
 
         if result_img_bytes:
-            cur.execute("UPDATE pf_users SET last_pfp_gen = %s WHERE user_id = %s", (now, user.id))
-            conn.commit()
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=result_img_bytes,
-                caption=f"🏆 **TRANSFORMATION COMPLETE** @{escape_name(user.username or user.first_name)}!",
-                parse_mode='Markdown'
+            conn = await db_connect()
+            cur = conn.cursor()
+            await stamp_cooldown(cur, "last_pfp_gen", user.id, now)
+            await conn.commit()
+            COOLDOWNS.hold("phatme", user.id, now + timedelta(hours=24))
+            chat_id = update.effective_chat.id
+            caption = f"🏆 **TRANSFORMATION COMPLETE** @{escape_name(user.username or user.first_name)}!"
+            SEND_QUEUE.submit(
+                chat_id,
+                lambda: context.bot.send_photo(chat_id=chat_id, photo=result_img_bytes, caption=caption, parse_mode='Markdown')
             )
-            await status_msg.delete()
-        else:
-            await status_msg.edit_text("⚠️ Synthesis failed.")
+            if status_msg:
+                SEND_QUEUE.submit(chat_id, status_msg.delete)
+        elif status_msg:
+            SEND_QUEUE.submit(update.effective_chat.id, lambda: status_msg.edit_text("⚠️ Synthesis failed."))
     except Exception as e:
         if conn:
-            conn.rollback()
+            await conn.rollback()
         logger.error(f"PhatMe Error: {e}")
-        await update.message.reply_text("❌ Kitchen Connection Lost.")
+        reply(update.message, "❌ Kitchen Connection Lost.")
     finally:
         safe_close(cur, conn)
 
@@ -1699,14 +2832,14 @@ async def reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
         if member.status not in ['administrator', 'creator']:
-            return await update.message.reply_text("🚫 **UNAUTHORIZED.**")
+            return reply(update.message, "🚫 **UNAUTHORIZED.**")
     except Exception as e:
         logger.error(f"Reward Member Check Error: {e}")
-        return await update.message.reply_text("⚠️ Admin check failed.")
+        return reply(update.message, "⚠️ Admin check failed.")
 
     target_user = update.message.reply_to_message.from_user if update.message.reply_to_message else None
     if not target_user:
-        return await update.message.reply_text("💡 Reply to someone.")
+        return reply(update.message, "💡 Reply to someone.")
 
     roll = random.random()
     if roll < 0.70:
@@ -1722,56 +2855,49 @@ async def reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = await db_connect()
         cur = conn.cursor()
-        ensure_user_record(cur, target_user)
-        cur.execute("""
-            UPDATE pf_users
-            SET daily_calories = daily_calories + %s,
-                total_calories = total_calories + %s
-            WHERE user_id = %s
-        """, (bonus, bonus, target_user.id))
-        conn.commit()
-        await update.message.reply_text(
+        await ensure_user_record(cur, target_user)
+        target_totals = await apply_calorie_delta(cur, target_user.id, bonus, kind="reward")
+        await conn.commit()
+        track_calorie_change(target_user.id, target_totals)
+        reply(update.message,
             f"🎯 **RAID REWARD: {tier}**\n"
             f"+{bonus:,} Cal to @{escape_name(target_user.username or target_user.first_name)}",
             parse_mode='Markdown'
         )
     except Exception as e:
         if conn:
-            conn.rollback()
+            await conn.rollback()
         logger.error(f"Reward Error: {e}")
-        await update.message.reply_text("⚠️ Reward dispenser jammed.")
+        reply(update.message, "⚠️ Reward dispenser jammed.")
     finally:
         safe_close(cur, conn)
 
+async def render_winners(cur):
+    await cur.execute("""
+        SELECT winner_type, username, CAST(score AS FLOAT), win_date
+        FROM pf_airdrop_winners
+        ORDER BY win_date DESC
+        LIMIT 15
+    """)
+    rows = cur.fetchall()
+    if not rows:
+        return "📜 Hall of Fame is empty.", None
+
+    text = "🏆 **THE AIRDROP LEGENDS** 🏆\n━━━━━━━━━━━━━━\n"
+    for r in rows:
+        icon = "🍔" if r[0] == 'DAILY PHATTEST' else "🧪"
+        score_val = f"{r[2]:.1f}%" if r[0] == 'TOP HACKER' else f"{int(r[2]):,}"
+        text += f"{icon} `{r[3].strftime('%m/%d')}` | **{r[0]}**: {escape_name(r[1])} ({score_val})\n"
+    return text, 'Markdown'
+
 async def winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    conn = None
-    cur = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT winner_type, username, CAST(score AS FLOAT), win_date
-            FROM pf_airdrop_winners
-            ORDER BY win_date DESC
-            LIMIT 15
-        """)
-        rows = cur.fetchall()
-        if not rows:
-            return await update.message.reply_text("📜 Hall of Fame is empty.")
-
-        text = "🏆 **THE AIRDROP LEGENDS** 🏆\n━━━━━━━━━━━━━━\n"
-        for r in rows:
-            icon = "🍔" if r[0] == 'DAILY PHATTEST' else "🧪"
-            score_val = f"{r[2]:.1f}%" if r[0] == 'TOP HACKER' else f"{int(r[2]):,}"
-            text += f"{icon} `{r[3].strftime('%m/%d')}` | **{r[0]}**: {escape_name(r[1])} ({score_val})\n"
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await serve_board(update, "winners", render_winners)
     except Exception as e:
         logger.error(f"Winners Error: {e}")
-        await update.message.reply_text("⚠️ Winners archive offline.")
-    finally:
-        safe_close(cur, conn)
+        reply(update.message, "⚠️ Winners archive offline.")
 
 async def set_bot_commands(application):
     cmds = [
@@ -1787,7 +2913,9 @@ async def set_bot_commands(application):
         ("clogboard", "Live Clog %"),
         ("deaths", "ICU Deaths"),
         ("phatme", "Phat PFP Generator"),
-        ("halloffame", "Eternal Champions")
+        ("halloffame", "Eternal Champions"),
+        ("weekly", "7-Day Gainers"),
+        ("history", "Your 7 Days")
     ]
     await application.bot.set_my_commands(cmds)
 
@@ -1801,7 +2929,7 @@ if __name__ == "__main__":
         b_id = None
 
     init_db(b_id)
-    app = ApplicationBuilder().token(TOKEN).build()
+    app = ApplicationBuilder().token(TOKEN).concurrent_updates(UPDATE_PROCESSOR).build()
     app.add_error_handler(error_handler)
 
     handlers = [
@@ -1819,17 +2947,87 @@ if __name__ == "__main__":
         ("deaths", deaths),
         ("winners", winners),
         ("phatme", phatme),
-        ("halloffame", halloffame)
+        ("halloffame", halloffame),
+        ("weekly", weekly),
+        ("history", history)
     ]
+    app.add_handler(TypeHandler(Update, observe_users), group=-1)
     for c, f in handlers:
         app.add_handler(CommandHandler(c, f))
 
     async def post_init(application):
+        SEND_QUEUE.start()
         await set_bot_commands(application)
-        application.create_task(automated_reset_task(application))
-        application.create_task(check_pings(application))
-        application.create_task(chef_rampage_task(application))
+        await load_rank_index()
+        await load_kitchen()
+        await load_gif_cache()
+        await load_usernames()
+        jobs = application.job_queue
+        if GIF_PREWARM_CHAT_ID:
+            jobs.run_once(prewarm_gifs_job, when=5, name="gif_prewarm")
+        jobs.run_repeating(kitchen_flush_job, interval=KITCHEN_FLUSH_SECONDS, first=KITCHEN_FLUSH_SECONDS, name="kitchen_flush")
+        jobs.run_repeating(content_reload_job, interval=CONTENT_WATCH_SECONDS, first=CONTENT_WATCH_SECONDS, name="content_reload")
+        jobs.run_repeating(username_refresh_job, interval=USERNAME_REFRESH_SECONDS, first=USERNAME_REFRESH_SECONDS, name="username_refresh")
+        jobs.run_repeating(event_flush_job, interval=EVENT_FLUSH_SECONDS, first=EVENT_FLUSH_SECONDS, name="event_flush")
+        if CALORIE_BUFFER.enabled:
+            interval = CALORIE_FLUSH_MS / 1000
+            jobs.run_repeating(calorie_flush_job, interval=interval, first=interval, name="calorie_flush")
+        jobs.run_daily(daily_reset_job, time=time(hour=DAILY_RESET_HOUR, tzinfo=timezone.utc), name="daily_reset")
+        # catch up on any day that closed while the bot was down, and re-arm a live rampage
+        jobs.run_once(daily_reset_job, when=0, name="daily_reset_catchup")
+        request_kitchen_tick(jobs)
         logger.info("🚀 Planet Fatness Online.")
 
-    app.post_init = post_init
-    app.run_polling(drop_pending_updates=True)
\ No newline at end of file
+    async def post_stop(application):
+        # the bot's HTTP client closes during shutdown, so drain queued messages first
+        await SEND_QUEUE.stop()
+
+    async def post_shutdown(application):
+        await flush_calories()
+        await flush_events()
+        await flush_kitchen()
+        DB_EXECUTOR.shutdown()
+        DB_POOL.closeall()
+
+    async def feed_update(payload):
+        await app.update_queue.put(Update.de_json(payload, app.bot))
+
+    async def serve():
+        """Runs the bot and the web server on one loop: webhook mode if WEBHOOK_URL is set, else polling."""
+        global ACCEPTING_UPDATES
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        WEB.on_update = feed_update
+        await WEB.start()
+        await app.initialize()
+        await post_init(app)
+        await app.start()
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
+            logger.info("📬 Receiving updates by webhook.")
+        else:
+            await app.updater.start_polling(drop_pending_updates=True)
+            logger.info("📬 Receiving updates by long polling.")
+        ACCEPTING_UPDATES = True
+
+        try:
+            await stop.wait()
+        finally:
+            ACCEPTING_UPDATES = False
+            if app.updater.running:
+                await app.updater.stop()
+            await app.stop()
+            await post_stop(app)
+            await app.shutdown()
+            await post_shutdown(app)
+            await WEB.stop()
+
+    asyncio.run(serve())
\ No newline at end of file
@@ -0,0 +1,168 @@
+class CalorieBuffer:
+    """Per-user calorie/heat deltas held in memory between bulk flushes.
+
+    With flush_ms at 0 the buffer is disabled and callers write through.
+    Otherwise flush_ms is also the durability window: deltas not yet flushed
+    are lost if the process dies."""
+
+    def __init__(self, flush_ms=0, max_users=500):
+        self.flush_ms = flush_ms
+        self.max_users = max_users
+        self.pending = {}  # (day epoch, user_id) -> [calories, heat, [(kind, calories, created_at)]]
+        self.stats = {
+            "deltas": 0,
+            "flushes": 0,
+            "rows_flushed": 0,
+            "largest_batch": 0,
+            "flush_errors": 0,
+            "requeued": 0
+        }
+
+    @property
+    def enabled(self):
+        return self.flush_ms > 0
+
+    def add(self, user_id, calories=0, heat=0, epoch=0, event=None):
+        """Queues a delta earned on game day `epoch`; returns True once the batch is big enough to flush early.
+
+        event is an optional (kind, created_at) to record in the ledger once the delta is applied."""
+        entry = self.pending.setdefault((epoch, user_id), [0, 0, []])
+        entry[0] += calories
+        entry[1] += heat
+        if event:
+            entry[2].append((event[0], calories, event[1]))
+        self.stats["deltas"] += 1
+        return len(self.pending) >= self.max_users
+
+    def pending_calories(self, user_id, epoch):
+        entry = self.pending.get((epoch, user_id))
+        return entry[0] if entry else 0
+
+    def has_heat(self):
+        return any(entry[1] for entry in self.pending.values())
+
+    def drain(self):
+        """Takes every queued delta as (epoch, user_ids, calories, heats, events) groups, oldest day first."""
+        if not self.pending:
+            return None
+        rows, self.pending = self.pending, {}
+        groups = []
+        # sorted keys give each group a fixed lock order, so overlapping flushes don't deadlock
+        for epoch, user_id in sorted(rows):
+            if not groups or groups[-1][0] != epoch:
+                groups.append((epoch, [], [], [], []))
+            for column, value in zip(groups[-1][1:], (user_id, *rows[(epoch, user_id)])):
+                column.append(value)
+        return groups
+
+    def requeue(self, batch):
+        """Puts a batch that failed to flush back in front of newer deltas."""
+        for epoch, user_ids, calories, heats, events in batch:
+            for user_id, cal, heat, evs in zip(user_ids, calories, heats, events):
+                entry = self.pending.setdefault((epoch, user_id), [0, 0, []])
+                entry[0] += cal
+                entry[1] += heat
+                entry[2][:0] = evs
+            self.stats["requeued"] += len(user_ids)
+
+    def mark_flushed(self, batch):
+        size = sum(len(group[1]) for group in batch)
+        self.stats["flushes"] += 1
+        self.stats["rows_flushed"] += size
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], size)
+
+    @staticmethod
+    def settle(events, applied):
+        """Splits the delta a flush actually applied back over the events that made it up.
+
+        The floor at zero only ever absorbs losses, so gains keep their full
+        value and losses are charged in order until the applied total is met."""
+        budget = applied - sum(cal for _, cal, _ in events if cal > 0)
+        settled = []
+        for kind, cal, created_at in events:
+            if cal < 0:
+                cal = max(cal, min(0, budget))
+                budget -= cal
+            settled.append((kind, cal, created_at))
+        return settled
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["enabled"] = self.enabled
+        data["flush_ms"] = self.flush_ms
+        data["pending_users"] = len(self.pending)
+        return data
+
+class EventLedger:
+    """Append-only calorie events buffered for COPY into pf_events.
+
+    Each flush also folds the batch into per-day totals, so the rollup table
+    stays current without ever rescanning raw events."""
+
+    def __init__(self, kinds, max_events=5000):
+        self.kinds = dict(kinds)  # name -> SMALLINT code stored in pf_events
+        self.max_events = max_events
+        self.pending = []         # (user_id, kind_code, delta, created_at)
+        self.stats = {
+            "events": 0,
+            "flushes": 0,
+            "rows_copied": 0,
+            "flush_errors": 0,
+            "dropped": 0
+        }
+
+    def record(self, user_id, kind, delta, created_at):
+        """Queues one event; returns True once the batch is big enough to flush early."""
+        if not delta:
+            return False
+        self.pending.append((user_id, self.kinds[kind], int(delta), created_at))
+        self.stats["events"] += 1
+        return len(self.pending) >= self.max_events
+
+    def drain(self):
+        if not self.pending:
+            return None
+        batch, self.pending = self.pending, []
+        return batch
+
+    def requeue(self, batch):
+        # a database that stays down must not grow the buffer without bound
+        room = max(0, self.max_events * 10 - len(self.pending))
+        kept = batch[:room]
+        self.pending[:0] = kept
+        self.stats["dropped"] += len(batch) - len(kept)
+
+    def mark_flushed(self, batch):
+        self.stats["flushes"] += 1
+        self.stats["rows_copied"] += len(batch)
+
+    @staticmethod
+    def copy_rows(batch):
+        """Renders a batch in COPY text format."""
+        return "".join(
+            f"{user_id}\t{kind}\t{delta}\t{created_at.isoformat(sep=' ')}\n"
+            for user_id, kind, delta, created_at in batch
+        )
+
+    @staticmethod
+    def rollup(batch, day_of):
+        """Sums a batch into (day, user_id, kind) -> (delta, events) column lists."""
+        totals = {}
+        for user_id, kind, delta, created_at in batch:
+            key = (day_of(created_at), user_id, kind)
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += delta
+            entry[1] += 1
+        keys = sorted(totals)
+        return (
+            [k[0] for k in keys],
+            [k[1] for k in keys],
+            [k[2] for k in keys],
+            [totals[k][0] for k in keys],
+            [totals[k][1] for k in keys]
+        )
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["pending"] = len(self.pending)
+        return data
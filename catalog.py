@@ -0,0 +1,249 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+from sampler import AliasSampler
+
+logger = logging.getLogger(__name__)
+
+# bump whenever the record classes or the compile step change shape
+CATALOG_FORMAT = 1
+DEFAULT_CACHE_PATH = ".catalog.cache"
+CONTENT_FILES = ("foods.json", "hacks.json", "gift_punishments.json")
+
+class CatalogError(ValueError):
+    pass
+
+class Food:
+    __slots__ = ("name", "calories", "tier", "category", "gif", "reward_phat")
+
+    def __init__(self, name, calories, tier=None, category=None, gif=None, reward_phat=None):
+        self.name = name
+        self.calories = calories
+        self.tier = tier
+        self.category = category
+        self.gif = gif
+        self.reward_phat = reward_phat
+
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self.__slots__)
+
+    def __setstate__(self, state):
+        for f, v in zip(self.__slots__, state):
+            setattr(self, f, v)
+
+class Hack:
+    __slots__ = ("id", "name", "franchise", "blueprint", "min_clog", "max_clog")
+
+    def __init__(self, id, name, franchise=None, blueprint=None, min_clog=1, max_clog=5):
+        self.id = id
+        self.name = name
+        self.franchise = franchise
+        self.blueprint = blueprint
+        self.min_clog = min_clog
+        self.max_clog = max_clog
+
+    __getstate__ = Food.__getstate__
+    __setstate__ = Food.__setstate__
+
+class Punishment:
+    __slots__ = ("name", "low", "high", "weight", "text")
+
+    def __init__(self, name, low, high, weight=1, text=None):
+        self.name = name
+        self.low = low
+        self.high = high
+        self.weight = weight
+        self.text = text
+
+    __getstate__ = Food.__getstate__
+    __setstate__ = Food.__setstate__
+
+def _compile_food(raw):
+    calories = int(raw["calories"])
+    reward = raw.get("reward_phat")
+    return Food(
+        str(raw["name"]),
+        calories,
+        raw.get("tier"),
+        raw.get("category"),
+        raw.get("gif"),
+        int(reward) if reward is not None else None
+    )
+
+def _compile_hack(raw):
+    low, high = int(raw.get("min_clog", 1)), int(raw.get("max_clog", 5))
+    if low > high:
+        low, high = high, low
+    return Hack(raw.get("id"), str(raw["name"]), raw.get("franchise"),
+                raw.get("blueprint", "Classified information."), low, high)
+
+def _compile_punishment(raw):
+    # the JSON lists min/max in either order, so normalise once here
+    low, high = int(raw.get("min", -1000)), int(raw.get("max", -500))
+    if low > high:
+        low, high = high, low
+    return Punishment(str(raw.get("name", "Cursed Delivery")), low, high,
+                      int(raw.get("weight", 1)), raw.get("text", "Something went horribly wrong."))
+
+class Catalog:
+    """Validated, immutable content with the lookups handlers need precomputed."""
+
+    def __init__(self, foods, hacks, punishments, source_hash=None, rejected=0):
+        self.foods = tuple(foods)
+        self.hacks = tuple(hacks)
+        self.punishments = tuple(punishments)
+        self.source_hash = source_hash
+        self.rejected = rejected
+
+        self.foods_by_tier = {}
+        self.foods_by_category = {}
+        for food in self.foods:
+            self.foods_by_tier.setdefault(food.tier, []).append(food)
+            self.foods_by_category.setdefault(food.category, []).append(food)
+        self.foods_by_tier = {k: tuple(v) for k, v in self.foods_by_tier.items()}
+        self.foods_by_category = {k: tuple(v) for k, v in self.foods_by_category.items()}
+        self.gains = tuple(f for f in self.foods if f.calories > 0)
+        self.losses = tuple(f for f in self.foods if f.calories < 0)
+
+    @classmethod
+    def compile(cls, foods_raw, hacks_raw, punishments_raw, source_hash=None):
+        rejected = 0
+        compiled = []
+        for label, raw_items, build in (
+            ("foods", foods_raw, _compile_food),
+            ("hacks", hacks_raw, _compile_hack),
+            ("punishments", punishments_raw, _compile_punishment)
+        ):
+            if not isinstance(raw_items, list):
+                raise CatalogError(f"{label} must be a JSON list")
+            items = []
+            for i, raw in enumerate(raw_items):
+                try:
+                    if not isinstance(raw, dict):
+                        raise TypeError("not an object")
+                    items.append(build(raw))
+                except (KeyError, TypeError, ValueError) as e:
+                    rejected += 1
+                    logger.warning(f"Catalog: skipping {label}[{i}]: {e!r}")
+            compiled.append(items)
+        return cls(*compiled, source_hash=source_hash, rejected=rejected)
+
+    @classmethod
+    def load(cls, foods_path="foods.json", hacks_path="hacks.json",
+             punishments_path="gift_punishments.json", cache_path=DEFAULT_CACHE_PATH):
+        """Loads from the sidecar cache when the source files are unchanged, else compiles and refreshes it."""
+        blobs = []
+        for path in (foods_path, hacks_path, punishments_path):
+            with open(path, "rb") as f:
+                blobs.append(f.read())
+
+        digest = hashlib.sha256(str(CATALOG_FORMAT).encode())
+        for blob in blobs:
+            digest.update(hashlib.sha256(blob).digest())
+        source_hash = digest.hexdigest()
+
+        cached = cls._read_cache(cache_path, source_hash)
+        if cached is not None:
+            return cached
+
+        catalog = cls.compile(*(json.loads(blob) for blob in blobs), source_hash=source_hash)
+        cls._write_cache(cache_path, catalog)
+        return catalog
+
+    @staticmethod
+    def _read_cache(cache_path, source_hash):
+        if not cache_path or not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, "rb") as f:
+                stored_hash, catalog = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Catalog cache unreadable, recompiling: {e}")
+            return None
+        return catalog if stored_hash == source_hash else None
+
+    @staticmethod
+    def _write_cache(cache_path, catalog):
+        if not cache_path:
+            return
+        tmp_path = f"{cache_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((catalog.source_hash, catalog), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Catalog cache not written: {e}")
+
+    def snapshot(self):
+        return {
+            "foods": len(self.foods),
+            "hacks": len(self.hacks),
+            "punishments": len(self.punishments),
+            "rejected": self.rejected,
+            "source_hash": (self.source_hash or "")[:12]
+        }
+
+class ContentSnapshot:
+    """A catalog plus the samplers built from it.
+
+    Reloads swap the whole snapshot as one reference, so a handler that took
+    a snapshot keeps drawing from consistent content until it finishes."""
+
+    __slots__ = ("catalog", "foods", "hacks", "punishments")
+
+    def __init__(self, catalog, tier_weights=None, category_weights=None):
+        self.catalog = catalog
+        self.foods = AliasSampler.by_fields(
+            catalog.foods,
+            {"tier": tier_weights or {}, "category": category_weights or {}}
+        )
+        self.hacks = AliasSampler(catalog.hacks)
+        self.punishments = AliasSampler(catalog.punishments, [p.weight for p in catalog.punishments])
+
+class CatalogWatcher:
+    """Polls the content files' mtimes and rebuilds content when any of them change."""
+
+    def __init__(self, build, paths=CONTENT_FILES):
+        self.build = build  # () -> new content; runs off the event loop
+        self.paths = tuple(paths)
+        self.mtimes = self._mtimes()
+        self.last_error = None
+        self.stats = {"checks": 0, "reloads": 0, "failures": 0}
+
+    def _mtimes(self):
+        stamps = []
+        for path in self.paths:
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def changed(self):
+        self.stats["checks"] += 1
+        return self._mtimes() != self.mtimes
+
+    def reload(self):
+        """Returns freshly built content, or None if the files fail to compile.
+
+        A broken edit is not retried until the files change again."""
+        mtimes = self._mtimes()
+        try:
+            content = self.build()
+        except Exception as e:
+            self.mtimes = mtimes
+            self.stats["failures"] += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Catalog reload failed: {self.last_error}")
+            return None
+        self.mtimes = mtimes
+        self.stats["reloads"] += 1
+        self.last_error = None
+        return content
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["last_error"] = self.last_error
+        return data
@@ -0,0 +1,62 @@
+class CooldownGate:
+    """In-memory "still cooling down" answers for per-user actions.
+
+    Only cooldowns known to be running are held; anything unknown or expired
+    falls through to Postgres, which stays the authority. Entries are
+    learned lazily from successful actions and from cooldowns the database
+    reports, so a restart just means a few extra database checks."""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self.entries = {}  # (action, user_id) -> (ready_at, detail)
+        self.stats = {"hits": 0, "misses": 0, "holds": 0, "cleared": 0, "skipped_full": 0}
+
+    def check(self, action, user_id, now):
+        """Returns (wait_seconds, detail) while a known cooldown runs, else None."""
+        key = (action, user_id)
+        entry = self.entries.get(key)
+        if entry is not None:
+            ready_at, detail = entry
+            if ready_at > now:
+                self.stats["hits"] += 1
+                return int((ready_at - now).total_seconds()), detail
+            del self.entries[key]
+        self.stats["misses"] += 1
+        return None
+
+    def hold(self, action, user_id, ready_at, detail=None):
+        key = (action, user_id)
+        if key not in self.entries and len(self.entries) >= self.max_entries:
+            self.prune(None)
+            if len(self.entries) >= self.max_entries:
+                self.stats["skipped_full"] += 1
+                return
+        self.entries[key] = (ready_at, detail)
+        self.stats["holds"] += 1
+
+    def forget(self, action, user_id):
+        """Drops one hold, e.g. when the action that set it was rolled back."""
+        self.entries.pop((action, user_id), None)
+
+    def clear(self, *actions):
+        """Forgets every held cooldown for the given actions (e.g. those the daily rollover wipes)."""
+        actions = set(actions)
+        stale = [key for key in self.entries if key[0] in actions]
+        for key in stale:
+            del self.entries[key]
+        self.stats["cleared"] += len(stale)
+
+    def prune(self, now):
+        """Drops expired entries; with now=None, drops the ones that expire soonest."""
+        if now is not None:
+            self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+            return
+        keep = sorted(self.entries.items(), key=lambda kv: kv[1][0])[len(self.entries) // 4:]
+        self.entries = dict(keep)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 3) if lookups else 0.0
+        data["entries"] = len(self.entries)
+        return data
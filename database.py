@@ -0,0 +1,291 @@
+import time
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import psycopg2
+    from psycopg2 import pool as pg_pool
+except ImportError:
+    psycopg2 = None
+    pg_pool = None
+
+logger = logging.getLogger(__name__)
+
+class DatabasePool:
+    def __init__(self, dsn, minconn=1, maxconn=10, healthcheck_seconds=30, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.healthcheck_seconds = healthcheck_seconds  # Idle time before a checkout gets pinged
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self._idle_since = {}
+        self.stats = {
+            "checkouts": 0,
+            "returns": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+            "health_checks": 0,
+            "discarded": 0,
+            "exhausted": 0
+        }
+
+    def _get_pool(self):
+        """Lazily opens the pool so importing the bot never touches the network."""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, self.dsn, **self.connect_kwargs
+                    )
+                    logger.info(f"🔌 DB pool opened (min={self.minconn}, max={self.maxconn})")
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+
+        idle_since = self._idle_since.get(id(conn))
+        if idle_since and time.monotonic() - idle_since < self.healthcheck_seconds:
+            return True
+
+        self.stats["health_checks"] += 1
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"DB pool health check failed: {e}")
+            return False
+
+    def getconn(self):
+        """Checks out a connection, replacing any that fail the health check."""
+        pool = self._get_pool()
+        for _ in range(self.maxconn + 1):
+            try:
+                conn = pool.getconn()
+            except pg_pool.PoolError:
+                self.stats["exhausted"] += 1
+                raise
+
+            if self._is_healthy(conn):
+                with self._lock:
+                    self._idle_since.pop(id(conn), None)
+                    self.stats["checkouts"] += 1
+                    self.stats["in_use"] += 1
+                    self.stats["peak_in_use"] = max(self.stats["peak_in_use"], self.stats["in_use"])
+                return conn
+
+            self.stats["discarded"] += 1
+            self._idle_since.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+
+        raise pg_pool.PoolError("no healthy connection available")
+
+    def putconn(self, conn):
+        """Returns a connection; open transactions are rolled back by the pool."""
+        if conn is None or self._pool is None:
+            return
+        close = bool(conn.closed)
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self.stats["returns"] += 1
+                self.stats["in_use"] = max(0, self.stats["in_use"] - 1)
+                if not close:
+                    self._idle_since[id(conn)] = time.monotonic()
+
+    def closeall(self):
+        if self._pool is not None and not self._pool.closed:
+            self._pool.closeall()
+            logger.info("🔌 DB pool closed.")
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+        data["min"] = self.minconn
+        data["max"] = self.maxconn
+        data["open"] = len(self._pool._pool) + len(self._pool._used) if self._pool and not self._pool.closed else 0
+        return data
+
+class AsyncCursor:
+    """Cursor whose round trips run on the DB executor; fetches read the client-side buffer."""
+    def __init__(self, cur, executor, connection=None):
+        self.raw = cur  # None until the first statement checks the connection out
+        self.executor = executor
+        self.connection = connection
+
+    async def _cursor(self):
+        if self.raw is None:
+            self.raw = (await self.connection.checkout()).cursor()
+        if self.connection:
+            self.connection.pending = True
+        return self.raw
+
+    async def execute(self, query, params=None):
+        cur = await self._cursor()
+        return await self.executor.run(cur.execute, query, params)
+
+    async def copy_expert(self, sql, file):
+        cur = await self._cursor()
+        return await self.executor.run(cur.copy_expert, sql, file)
+
+    def fetchone(self):
+        return self.raw.fetchone()
+
+    def fetchall(self):
+        return self.raw.fetchall()
+
+    @property
+    def rowcount(self):
+        return self.raw.rowcount
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.close()
+
+class AsyncConnection:
+    """A pooled connection that is only checked out when its first statement runs.
+
+    A handler whose work all went to in-memory buffers never takes a pool
+    slot, and commit/rollback skip the round trip when no statement ran."""
+    def __init__(self, conn, executor):
+        self.raw = conn
+        self.executor = executor
+        self.pending = False  # a statement ran since the last commit/rollback
+        self._after_commit = []
+
+    async def checkout(self):
+        if self.raw is None:
+            self.raw = await self.executor.checkout()
+        return self.raw
+
+    def cursor(self):
+        return AsyncCursor(self.raw.cursor() if self.raw is not None else None, self.executor, self)
+
+    def after_commit(self, callback):
+        """Runs callback() once the current transaction commits; a rollback discards it."""
+        self._after_commit.append(callback)
+
+    async def commit(self):
+        callbacks, self._after_commit = self._after_commit, []
+        result = None
+        if self.pending:
+            result = await self.executor.run(self.raw.commit)
+            self.pending = False
+        else:
+            self.executor.stats["commits_skipped"] += 1
+        for callback in callbacks:
+            callback()
+        return result
+
+    async def rollback(self):
+        self._after_commit = []
+        if not self.pending:
+            return None
+        self.pending = False
+        return await self.executor.run(self.raw.rollback)
+
+    async def execute_atomic(self, query, params=None):
+        """Runs one self-contained statement (e.g. a stored function) in autocommit: a single round trip."""
+        raw = await self.checkout()
+        return await self.executor.run(self._execute_atomic, raw, query, params)
+
+    @staticmethod
+    def _execute_atomic(raw, query, params):
+        raw.autocommit = True
+        cur = raw.cursor()
+        try:
+            cur.execute(query, params)
+            return cur.fetchall()
+        finally:
+            cur.close()
+            raw.autocommit = False
+
+class DatabaseExecutor:
+    def __init__(self, pool, max_workers=None):
+        self.pool = pool
+        self.max_workers = max_workers or pool.maxconn
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pf-db")
+        self._slots = None
+        self.stats = {
+            "calls": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "waiting_for_conn": 0,
+            "sessions_open": 0,
+            "peak_sessions_open": 0,
+            "sessions_unused": 0,
+            "commits_skipped": 0,
+            "slowest_ms": 0.0,
+            "total_ms": 0.0
+        }
+
+    async def run(self, fn, *args):
+        """Runs a blocking DB call on a worker thread so the event loop keeps serving updates."""
+        loop = asyncio.get_running_loop()
+        self.stats["calls"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats["in_flight"] -= 1
+            self.stats["total_ms"] += elapsed_ms
+            self.stats["slowest_ms"] = max(self.stats["slowest_ms"], elapsed_ms)
+
+    async def connect(self):
+        """Returns a connection that takes its pool slot on first use."""
+        return AsyncConnection(None, self)
+
+    async def checkout(self):
+        """Waits on the loop (not a worker) for a pool slot, then checks out a connection."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool.maxconn)
+
+        self.stats["waiting_for_conn"] += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats["waiting_for_conn"] -= 1
+
+        try:
+            conn = await self.run(self.pool.getconn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        self.stats["sessions_open"] += 1
+        self.stats["peak_sessions_open"] = max(self.stats["peak_sessions_open"], self.stats["sessions_open"])
+        return conn
+
+    def release(self, conn):
+        """Hands the connection back without blocking; the pool may need to roll it back."""
+        if conn.raw is None:
+            self.stats["sessions_unused"] += 1
+            return
+        self.stats["sessions_open"] = max(0, self.stats["sessions_open"] - 1)
+        future = self._executor.submit(self.pool.putconn, conn.raw)
+        if self._slots is not None:
+            # The slot frees only once the pool has the connection back, so it never over-commits
+            loop = asyncio.get_running_loop()
+            future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._slots.release))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["workers"] = self.max_workers
+        data["avg_ms"] = round(data["total_ms"] / data["calls"], 2) if data["calls"] else 0.0
+        return data
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+
+try:
+    from telegram.ext import BaseUpdateProcessor
+except ImportError:
+    BaseUpdateProcessor = object
+
+class KeyedLocks:
+    """One asyncio lock per key, created on demand and dropped once nobody holds or waits on it."""
+
+    def __init__(self):
+        self.locks = {}  # key -> [lock, holders + waiters]
+        self.stats = {"acquires": 0, "contended": 0, "peak_keys": 0}
+
+    async def acquire(self, key):
+        entry = self.locks.get(key)
+        if entry is None:
+            entry = self.locks[key] = [asyncio.Lock(), 0]
+            self.stats["peak_keys"] = max(self.stats["peak_keys"], len(self.locks))
+        entry[1] += 1
+        if entry[0].locked():
+            self.stats["contended"] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._unref(key, entry)
+            raise
+        self.stats["acquires"] += 1
+
+    def release(self, key):
+        entry = self.locks[key]
+        entry[0].release()
+        self._unref(key, entry)
+
+    def _unref(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.locks[key]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["keys"] = len(self.locks)
+        data["waiting"] = sum(max(0, n - 1) for _, n in self.locks.values())
+        return data
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates from different users concurrently and each user's updates one at a time.
+
+    The per-user lock is taken in do_process_update, PTB's documented
+    extension point, so it sits inside the concurrency slot: an update
+    waiting on its user's earlier updates holds a slot while it waits."""
+
+    def __init__(self, max_concurrent_updates=32, locks=None):
+        super().__init__(max_concurrent_updates)
+        self.locks = locks or KeyedLocks()
+
+    @staticmethod
+    def key_for(update):
+        user = getattr(update, "effective_user", None)
+        if user:
+            return user.id
+        chat = getattr(update, "effective_chat", None)
+        return ("chat", chat.id) if chat else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.key_for(update)
+        if key is None:
+            await coroutine
+            return
+        async with self.locks.hold(key):
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def snapshot(self):
+        data = self.locks.snapshot()
+        data["max_concurrent_updates"] = self.max_concurrent_updates
+        return data
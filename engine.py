@@ -1,19 +1,25 @@
 import time
-import random
+from sampler import AliasSampler
 
 class BulkinatorEngine:
-    def __init__(self, food_data):
-        # Filter for calorie-positive items for the game
-        self.meals = [f for f in food_data if f.get('calories', 0) > 0]
+    def __init__(self, catalog, meal_sampler=None):
+        # Only calorie-positive items are playable; the catalog keeps them pre-filtered
+        self.meals = catalog.gains
+        self.meal_sampler = meal_sampler or AliasSampler(self.meals)
         self.active_bulks = {}      
         self.SHOUT_VALUE = 0.5      # Seconds added per shout
         self.MAX_SHOUTS_TOTAL = 20  # Max total shouts per session
         self.USER_SHOUT_LIMIT = 3   # Max shouts per individual spotter
 
+    def reload(self, catalog):
+        """Swaps in new content; live sessions keep the food they were dealt."""
+        meals = catalog.gains
+        self.meal_sampler, self.meals = AliasSampler(meals), meals
+
     def initialize_session(self, chat_id, target_user_id):
         """Starts a new high-stakes ambush."""
-        food = random.choice(self.meals)
-        calories = food.get('calories', 500)
+        food = self.meal_sampler.draw()
+        calories = food.calories
         
         # Scaling difficulty based on calorie count
         reps_needed = 20 + (calories // 100)
@@ -0,0 +1,157 @@
+import time
+from datetime import timedelta
+
+class KitchenState:
+    """Authoritative in-process copy of the kitchen (meter, rage, rampage bookkeeping).
+
+    Every mutation is a plain synchronous method, so on the single event loop
+    concurrent smacks apply one after another without waiting on a row lock.
+    The owner persists `row()` in the background whenever `dirty` is set."""
+
+    FIELDS = (
+        "meter",
+        "rage",
+        "rampage_until",
+        "last_rage_announce_level",
+        "last_rampage_reminder_at",
+        "rampage_end_announced_for"
+    )
+
+    def __init__(self):
+        self.meter = 0
+        self.rage = 0
+        self.rampage_until = None
+        self.last_rage_announce_level = 0
+        self.last_rampage_reminder_at = None
+        self.rampage_end_announced_for = None
+        self.loaded = False
+        self.version = 0          # bumped on every mutation
+        self.flushed_version = 0  # last version known to be in the database
+        self.stats = {
+            "mutations": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "rage_adds": 0,
+            "peak_rage_adds_per_second": 0,
+            "tier_announcements": 0,
+            "rampages_started": 0
+        }
+        self._rage_second = 0     # monotonic second of the current burst bucket
+        self._rage_in_second = 0
+
+    def load(self, row):
+        if row:
+            for field, value in zip(self.FIELDS, row):
+                setattr(self, field, value)
+        self.meter = self.meter or 0
+        self.rage = self.rage or 0
+        self.last_rage_announce_level = self.last_rage_announce_level or 0
+        self.loaded = True
+        self.flushed_version = self.version
+
+    def _touch(self):
+        self.version += 1
+        self.stats["mutations"] += 1
+
+    @property
+    def dirty(self):
+        return self.version != self.flushed_version
+
+    def row(self):
+        return self.version, tuple(getattr(self, field) for field in self.FIELDS)
+
+    def mark_flushed(self, version):
+        self.flushed_version = max(self.flushed_version, version)
+        self.stats["flushes"] += 1
+
+    def rampage_live(self, now):
+        return bool(self.rampage_until and self.rampage_until > now)
+
+    def add_rage(self, amount):
+        """Adds rage and returns the new total; increments never leave the process."""
+        self.rage += amount
+        self._touch()
+        self._count_rage_add()
+        return self.rage
+
+    def _count_rage_add(self):
+        self.stats["rage_adds"] += 1
+        second = int(time.monotonic())
+        if second != self._rage_second:
+            self._rage_second, self._rage_in_second = second, 0
+        self._rage_in_second += 1
+        self.stats["peak_rage_adds_per_second"] = max(self.stats["peak_rage_adds_per_second"], self._rage_in_second)
+
+    def start_rampage(self, now, duration=timedelta(hours=1)):
+        """Starts a rampage unless one is already live; returns the active end time."""
+        if not self.rampage_live(now):
+            self.rampage_until = now + duration
+            self.last_rampage_reminder_at = None
+            self.rampage_end_announced_for = None
+            self._touch()
+            self.stats["rampages_started"] += 1
+        return self.rampage_until
+
+    def end_rampage(self, now):
+        """Cools the kitchen off early (a snack roll); returns True if a rampage was live."""
+        if not self.rampage_live(now):
+            return False
+        self.rage = 0
+        self.rampage_until = None
+        self.last_rampage_reminder_at = None
+        self.rampage_end_announced_for = None
+        self._touch()
+        return True
+
+    def add_to_meter(self, amount):
+        self.meter += amount
+        self._touch()
+        return self.meter
+
+    def reset_meter(self):
+        self.meter = 0
+        self._touch()
+
+    def claim_rage_tier(self, tier):
+        """True exactly once per tier crossing, so only one caller announces it."""
+        if tier == 0 or tier <= self.last_rage_announce_level:
+            return False
+        self.last_rage_announce_level = tier
+        self._touch()
+        self.stats["tier_announcements"] += 1
+        return True
+
+    def claim_reminder(self, now, interval):
+        """Returns (send_now, next_due) for the periodic rampage reminder."""
+        last = self.last_rampage_reminder_at
+        if last and now - last < interval:
+            return False, last + interval
+        self.last_rampage_reminder_at = now
+        self._touch()
+        return True, now + interval
+
+    def claim_rampage_end(self, old_until, now):
+        """True once when a rampage has run out and its end has not been announced."""
+        if not old_until or old_until > now or self.rampage_end_announced_for == old_until:
+            return False
+        self.rampage_end_announced_for = old_until
+        self.last_rampage_reminder_at = None
+        self._touch()
+        return True
+
+    def reset_day(self):
+        self.rage = 0
+        self.rampage_until = None
+        self.last_rage_announce_level = 0
+        self.last_rampage_reminder_at = None
+        self.rampage_end_announced_for = None
+        self._touch()
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["loaded"] = self.loaded
+        data["dirty"] = self.dirty
+        data["rage"] = self.rage
+        data["meter"] = self.meter
+        data["rampage_until"] = self.rampage_until.isoformat() if self.rampage_until else None
+        return data
@@ -1,9 +1,10 @@
-import os, logging, random, json, psycopg2, threading, time
+import os, logging, random, psycopg2, threading, time, asyncio
 from flask import Flask
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes
 from engine import BulkinatorEngine
+from catalog import Catalog, CatalogWatcher, ContentSnapshot
 
 # --- WEB SERVER (For Render Health Checks) ---
 flask_app = Flask(__name__)
@@ -18,13 +19,13 @@ def run_flask():
 logging.basicConfig(level=logging.INFO)
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
+CONTENT_WATCH_SECONDS = int(os.getenv("CONTENT_WATCH_SECONDS", "10"))
 GROUP_CHAT_ID = -1003758442357  # Your verified Group ID
 BURN_AMOUNT = 500 
 
-with open('foods.json', 'r') as f:
-    foods = json.load(f)
-
-bulkinator = BulkinatorEngine(foods)
+content = ContentSnapshot(Catalog.load())
+bulkinator = BulkinatorEngine(content.catalog)
+content_watcher = CatalogWatcher(lambda: ContentSnapshot(Catalog.load()))
 
 # --- DATABASE HELPERS ---
 def get_db_connection():
@@ -33,8 +34,7 @@ def get_db_connection():
 def init_db():
     conn = get_db_connection()
     cur = conn.cursor()
-    # Ensure standard user columns exist
-    cur.execute("ALTER TABLE pf_users ADD COLUMN IF NOT EXISTS daily_calories INTEGER DEFAULT 0;")
+    # pf_users and pf_user_counters belong to bot.py's migrations
     # Create Global Stats table for tracking "Supply Burn"
     cur.execute("""
         CREATE TABLE IF NOT EXISTS pf_stats (
@@ -62,18 +62,19 @@ def update_user_calories(user_id, username, cal_gain):
     cur = conn.cursor()
     now = datetime.now()
     cur.execute('''
-        INSERT INTO pf_users (user_id, username, total_calories, daily_calories, last_snack)
-        VALUES (%s, %s, %s, %s, %s)
+        SELECT pf_roll_day(%s, pf_day_epoch((NOW() AT TIME ZONE 'UTC')::TIMESTAMP));
+        INSERT INTO pf_users (user_id, username)
+        VALUES (%s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+        WHERE pf_users.username IS DISTINCT FROM EXCLUDED.username;
+        INSERT INTO pf_user_counters (user_id, day_epoch, total_calories, daily_calories, last_snack)
+        VALUES (%s, pf_day_epoch((NOW() AT TIME ZONE 'UTC')::TIMESTAMP), %s, %s, %s)
         ON CONFLICT (user_id) DO UPDATE SET
-            username = EXCLUDED.username,
-            total_calories = pf_users.total_calories + EXCLUDED.total_calories,
-            daily_calories = CASE 
-                WHEN pf_users.last_snack < CURRENT_DATE THEN EXCLUDED.daily_calories 
-                ELSE pf_users.daily_calories + EXCLUDED.daily_calories 
-            END,
+            total_calories = pf_user_counters.total_calories + EXCLUDED.total_calories,
+            daily_calories = pf_user_counters.daily_calories + EXCLUDED.daily_calories,
             last_snack = EXCLUDED.last_snack
         RETURNING total_calories, daily_calories;
-    ''', (user_id, username, cal_gain, cal_gain, now))
+    ''', (user_id, user_id, username, user_id, cal_gain, cal_gain, now))
     res = cur.fetchone()
     conn.commit(); cur.close(); conn.close()
     return res
@@ -108,7 +109,7 @@ async def burnstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def start_bulkinator_session(chat_id, user_id, username, context):
     session = bulkinator.initialize_session(chat_id, user_id)
-    cals = session['food'].get('calories', 0)
+    cals = session['food'].calories
     is_boss = cals >= 3000
     
     header = "🚨🚨 **BOSS BATTLE** 🚨🚨" if is_boss else "🚨 **BULKINATOR AMBUSH** 🚨"
@@ -117,7 +118,7 @@ async def start_bulkinator_session(chat_id, user_id, username, context):
     text = (
         f"{header}\n\n"
         f"Watch out, @{username}!\n"
-        f"The Bulkinator demands you finish: **{session['food']['name'].upper()}** ({cals} kcal)\n\n"
+        f"The Bulkinator demands you finish: **{session['food'].name.upper()}** ({cals} kcal)\n\n"
         f"Status: {bar}\n"
         f"Inhale **{session['reps_needed']} reps** in 30s or I burn the supply!"
     )
@@ -140,8 +141,8 @@ async def handle_interactions(update: Update, context: ContextTypes.DEFAULT_TYPE
     state = bulkinator.active_bulks.get(chat_id)
 
     if result == "SUCCESS":
-        totals = update_user_calories(user_id, username, state['food']['calories'])
-        await query.edit_message_text(f"🏆 *GAINS SECURED*\n\n@{username} inhaled the {state['food']['name']}!\n📈 All-Time: {totals[0]:,} Cal")
+        totals = update_user_calories(user_id, username, state['food'].calories)
+        await query.edit_message_text(f"🏆 *GAINS SECURED*\n\n@{username} inhaled the {state['food'].name}!\n📈 All-Time: {totals[0]:,} Cal")
     elif result == "PROGRESS":
         bar = get_progress_bar(state['reps_current'], state['reps_needed'])
         keyboard = [[InlineKeyboardButton(f"🏋️ EAT ({state['reps_current']}/{state['reps_needed']})", callback_data="bulk_rep")],
@@ -166,7 +167,7 @@ async def snack(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT last_snack FROM pf_users WHERE user_id = %s", (user_id,))
+    cur.execute("SELECT last_snack FROM pf_user_counters WHERE user_id = %s", (user_id,))
     row = cur.fetchone()
     
     if row and row[0] and now - row[0] < timedelta(hours=1):
@@ -174,18 +175,18 @@ async def snack(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"⌛️ Digesting. Try in {int(remaining.total_seconds()//60)}m.")
         return
 
-    food_item = random.choice(foods)
-    totals = update_user_calories(user_id, username, food_item['calories'])
+    food_item = content.foods.draw()
+    totals = update_user_calories(user_id, username, food_item.calories)
     
     await update.message.reply_text(
-        f"🍪 Snack: {food_item['name']} ({food_item['calories']:+d} Cal)\n"
+        f"🍪 Snack: {food_item.name} ({food_item.calories:+d} Cal)\n"
         f"📈 All-Time: {totals[0]:,} | 🔥 Daily: {totals[1]:,}"
     )
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT username, total_calories FROM pf_users ORDER BY total_calories DESC LIMIT 10")
+    cur.execute("SELECT u.username, c.total_calories FROM pf_user_counters c JOIN pf_users u ON u.user_id = c.user_id ORDER BY c.total_calories DESC LIMIT 10")
     rows = cur.fetchall()
     text = "🏆 ALL-TIME PHATTEST 🏆\n\n" + "\n".join([f"{i+1}. {r[0]}: {r[1]:,} Cal" for i, r in enumerate(rows)])
     await update.message.reply_text(text)
@@ -193,15 +194,25 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT username, daily_calories FROM pf_users WHERE last_snack >= NOW() - INTERVAL '24 hours' ORDER BY daily_calories DESC LIMIT 10")
+    cur.execute("SELECT u.username, c.daily_calories FROM pf_user_counters c JOIN pf_users u ON u.user_id = c.user_id WHERE c.last_snack >= NOW() - INTERVAL '24 hours' ORDER BY c.daily_calories DESC LIMIT 10")
     rows = cur.fetchall()
     text = "🔥 24H TOP MUNCHERS 🔥\n\n" + "\n".join([f"{i+1}. {r[0]}: {r[1]:,} Cal" for i, r in enumerate(rows)])
     await update.message.reply_text(text)
 
+async def content_reload_callback(context: ContextTypes.DEFAULT_TYPE):
+    global content
+    if not content_watcher.changed():
+        return
+    fresh = await asyncio.get_running_loop().run_in_executor(None, content_watcher.reload)
+    if fresh is not None:
+        content = fresh
+        bulkinator.reload(fresh.catalog)
+        logging.info(f"Content reloaded ({len(fresh.catalog.foods)} foods).")
+
 async def passive_hunt_callback(context: ContextTypes.DEFAULT_TYPE):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT user_id, username FROM pf_users WHERE last_snack >= NOW() - INTERVAL '24 hours' AND username NOT LIKE '%bot'")
+    cur.execute("SELECT u.user_id, u.username FROM pf_user_counters c JOIN pf_users u ON u.user_id = c.user_id WHERE c.last_snack >= NOW() - INTERVAL '24 hours' AND u.username NOT LIKE '%bot'")
     active_users = cur.fetchall()
     cur.close(); conn.close()
     
@@ -219,6 +230,7 @@ if __name__ == '__main__':
     
     if app.job_queue:
         app.job_queue.run_repeating(passive_hunt_callback, interval=random.randint(7200, 14400), first=10)
+        app.job_queue.run_repeating(content_reload_callback, interval=CONTENT_WATCH_SECONDS, first=CONTENT_WATCH_SECONDS)
     else:
         logging.error("Job Queue could not be initialized.")
 
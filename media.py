@@ -0,0 +1,41 @@
+class FileIdCache:
+    """Maps external media URLs to the Telegram file_id of an earlier upload.
+
+    Resending by file_id skips Telegram's fetch of the URL. The owner persists
+    entries; a BadRequest on a cached id should invalidate it."""
+
+    def __init__(self):
+        self.file_ids = {}
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "invalidated": 0, "prewarmed": 0}
+
+    def load(self, rows):
+        self.file_ids = {url: file_id for url, file_id in rows if url and file_id}
+
+    def get(self, url):
+        file_id = self.file_ids.get(url)
+        self.stats["hits" if file_id else "misses"] += 1
+        return file_id
+
+    def put(self, url, file_id):
+        """Returns True when the mapping is new or changed (i.e. worth persisting)."""
+        if not url or not file_id or self.file_ids.get(url) == file_id:
+            return False
+        self.file_ids[url] = file_id
+        self.stats["stored"] += 1
+        return True
+
+    def invalidate(self, url):
+        if self.file_ids.pop(url, None) is not None:
+            self.stats["invalidated"] += 1
+            return True
+        return False
+
+    def missing(self, urls):
+        return [url for url in dict.fromkeys(urls) if url and url not in self.file_ids]
+
+    def snapshot(self):
+        data = dict(self.stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 3) if lookups else 0.0
+        data["entries"] = len(self.file_ids)
+        return data
@@ -0,0 +1,284 @@
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+
+try:
+    from telegram.error import RetryAfter
+except ImportError:
+    RetryAfter = None
+
+logger = logging.getLogger(__name__)
+
+# lower lanes always go first within a chat and across chats
+LANE_ANNOUNCE = 0
+LANE_REPLY = 1
+LANE_NAG = 2        # cooldown nags: dropped once stale rather than sent late
+LANE_BACKGROUND = 3
+LANES = ("announce", "reply", "nag", "background")
+
+MAX_MESSAGE_LENGTH = 4096
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class _Outgoing:
+    __slots__ = ("lane", "seq", "send", "text", "merge_key", "futures", "enqueued_at", "raise_errors", "attempts")
+
+    def __init__(self, lane, seq, send, text, merge_key, future, raise_errors):
+        self.lane = lane
+        self.seq = seq
+        self.send = send            # send() or, for mergeable text, send(text)
+        self.text = text
+        self.merge_key = merge_key
+        self.futures = [future]
+        self.enqueued_at = time.monotonic()
+        self.raise_errors = raise_errors
+        self.attempts = 0
+
+class _Chat:
+    __slots__ = ("lanes", "bucket", "blocked_until", "busy")
+
+    def __init__(self, bucket):
+        self.lanes = tuple(deque() for _ in LANES)
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.busy = False  # one send in flight per chat keeps its messages in order
+
+    def head(self):
+        for lane in self.lanes:
+            if lane:
+                return lane[0]
+        return None
+
+class SendQueue:
+    """Schedules every outbound Bot API call behind per-chat and global token buckets.
+
+    Callers get a future for the sent Message and usually don't await it, so
+    a rate-limited chat never stalls the handler that queued the message.
+    A 429 pauses only that chat for retry_after and the message is retried.
+    Queued announcements to the same chat are sent as one merged message, and
+    a new announcement with the same merge_key replaces a queued one."""
+
+    def __init__(self, global_per_second=25, chat_per_minute=20, chat_burst=5,
+                 nag_ttl_seconds=30, max_attempts=5):
+        self.global_bucket = TokenBucket(global_per_second, global_per_second)
+        self.chat_rate = chat_per_minute / 60
+        self.chat_burst = chat_burst
+        self.nag_ttl_seconds = nag_ttl_seconds
+        self.max_attempts = max_attempts
+        self.chats = {}
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._worker = None
+        self._inflight = set()
+        self._latencies = deque(maxlen=500)
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "merged": 0,
+            "superseded": 0,
+            "stale_dropped": 0,
+            "retry_after": 0,
+            "failed": 0,
+            "peak_depth": 0
+        }
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """Gives queued messages up to `timeout` seconds to go out, then stops the worker."""
+        if not self._worker:
+            return
+        deadline = time.monotonic() + timeout
+        while (self.depth() or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._worker.cancel()
+        self._worker = None
+        for chat in self.chats.values():
+            for lane in chat.lanes:
+                for item in lane:
+                    self._resolve(item, None)
+        self.chats.clear()
+
+    def submit(self, chat_id, send, lane=LANE_REPLY, raise_errors=False):
+        """Queues send() and returns a future for its result.
+
+        Failures are logged; the future gets None unless raise_errors is set."""
+        return self._enqueue(chat_id, lane, send, None, None, raise_errors)
+
+    def announce(self, chat_id, send, text, merge_key=None):
+        """Queues send(text) in the announcement lane, where it may be merged with its neighbours."""
+        return self._enqueue(chat_id, LANE_ANNOUNCE, send, text, merge_key, False)
+
+    def _enqueue(self, chat_id, lane, send, text, merge_key, raise_errors):
+        future = asyncio.get_running_loop().create_future()
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+        self.stats["enqueued"] += 1
+
+        if merge_key is not None:
+            for queued in chat.lanes[lane]:
+                if queued.merge_key == merge_key:
+                    # the newer announcement makes the queued one obsolete
+                    queued.send, queued.text = send, text
+                    queued.futures.append(future)
+                    self.stats["superseded"] += 1
+                    return future
+
+        chat.lanes[lane].append(_Outgoing(lane, next(self._seq), send, text, merge_key, future, raise_errors))
+        self.stats["peak_depth"] = max(self.stats["peak_depth"], self.depth())
+        if self._wakeup:
+            self._wakeup.set()
+        return future
+
+    def depth(self):
+        return sum(len(lane) for chat in self.chats.values() for lane in chat.lanes)
+
+    async def _run(self):
+        while True:
+            timeout = self._dispatch(time.monotonic())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, now):
+        """Starts every send that is allowed right now; returns seconds until the next one may be."""
+        next_at = None
+        ready = []
+        for chat_id, chat in list(self.chats.items()):
+            self._drop_stale_nags(chat, now)
+            head = chat.head()
+            if head is None:
+                if not chat.busy and chat.bucket.full(now):
+                    del self.chats[chat_id]
+                continue
+            if chat.busy:
+                continue
+            due = max(chat.blocked_until, now + chat.bucket.wait(now))
+            if due > now:
+                next_at = due if next_at is None else min(next_at, due)
+                continue
+            ready.append((head.lane, head.seq, chat_id))
+
+        for _, _, chat_id in sorted(ready):
+            wait = self.global_bucket.wait(now)
+            if wait:
+                next_at = now + wait if next_at is None else min(next_at, now + wait)
+                break
+            chat = self.chats[chat_id]
+            item = self._pop(chat)
+            self.global_bucket.take()
+            chat.bucket.take()
+            chat.busy = True
+            task = asyncio.create_task(self._deliver(chat, item))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+        return None if next_at is None else max(0, next_at - now)
+
+    def _drop_stale_nags(self, chat, now):
+        nags = chat.lanes[LANE_NAG]
+        while nags and now - nags[0].enqueued_at > self.nag_ttl_seconds:
+            self._resolve(nags.popleft(), None)
+            self.stats["stale_dropped"] += 1
+
+    def _pop(self, chat):
+        for lane in chat.lanes:
+            if lane:
+                item = lane.popleft()
+                break
+        if item.text is None:
+            return item
+        # fold the announcements queued behind this one into a single message
+        while lane and lane[0].text is not None and \
+                len(item.text) + len(lane[0].text) + 2 <= MAX_MESSAGE_LENGTH:
+            nxt = lane.popleft()
+            item.text = f"{item.text}\n\n{nxt.text}"
+            item.futures.extend(nxt.futures)
+            self.stats["merged"] += 1
+        return item
+
+    async def _deliver(self, chat, item):
+        try:
+            result = await (item.send(item.text) if item.text is not None else item.send())
+        except Exception as e:
+            item.attempts += 1
+            retry_after = self._retry_after(e)
+            if retry_after is not None and item.attempts < self.max_attempts:
+                self.stats["retry_after"] += 1
+                chat.blocked_until = time.monotonic() + retry_after
+                chat.lanes[item.lane].appendleft(item)
+                logger.warning(f"Flood wait: pausing chat for {retry_after:.0f}s")
+            else:
+                self.stats["failed"] += 1
+                logger.warning(f"Send failed: {e}")
+                self._resolve(item, None, e if item.raise_errors else None)
+        else:
+            self.stats["sent"] += 1
+            self._latencies.append(time.monotonic() - item.enqueued_at)
+            self._resolve(item, result)
+        finally:
+            chat.busy = False
+            if self._wakeup:
+                self._wakeup.set()
+
+    @staticmethod
+    def _retry_after(error):
+        if RetryAfter is None or not isinstance(error, RetryAfter):
+            return None
+        delay = error.retry_after
+        return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+    @staticmethod
+    def _resolve(item, result, error=None):
+        for future in item.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["depth"] = self.depth()
+        data["depth_by_lane"] = {
+            name: sum(len(chat.lanes[i]) for chat in self.chats.values()) for i, name in enumerate(LANES)
+        }
+        data["in_flight"] = len(self._inflight)
+        data["paused_chats"] = sum(1 for chat in self.chats.values() if chat.blocked_until > time.monotonic())
+        latencies = sorted(self._latencies)
+        if latencies:
+            data["latency_ms_p50"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            data["latency_ms_p95"] = round(latencies[int(len(latencies) * 0.95)] * 1000, 1)
+            data["latency_ms_max"] = round(latencies[-1] * 1000, 1)
+        return data
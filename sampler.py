@@ -0,0 +1,64 @@
+import random
+
+class AliasSampler:
+    """Weighted random choice in O(1) per draw (Vose's alias method).
+
+    Tables are built once in O(n); items with a non-positive weight are
+    never drawn. With no weights every item is equally likely, exactly like
+    random.choice."""
+
+    __slots__ = ("items", "prob", "alias", "size")
+
+    def __init__(self, items, weights=None):
+        items = list(items)
+        if weights is None:
+            weights = [1.0] * len(items)
+        pairs = [(item, float(w)) for item, w in zip(items, weights) if float(w) > 0]
+
+        self.items = tuple(item for item, _ in pairs)
+        self.size = len(pairs)
+        self.prob = [1.0] * self.size
+        self.alias = list(range(self.size))
+        if not self.size:
+            return
+
+        total = sum(w for _, w in pairs)
+        scaled = [w * self.size / total for _, w in pairs]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # whatever is left is 1.0 up to float rounding
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    @classmethod
+    def by_fields(cls, items, field_weights):
+        """Weights each item by the product of per-field tables, e.g. {"tier": {...}, "category": {...}}.
+
+        Values missing from a table weigh 1."""
+        items = list(items)
+        weights = []
+        for item in items:
+            w = 1.0
+            for field, table in field_weights.items():
+                w *= table.get(getattr(item, field, None), 1.0)
+            weights.append(w)
+        return cls(items, weights)
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def draw(self, rng=random):
+        if not self.size:
+            raise IndexError("cannot draw from an empty sampler")
+        i = int(rng.random() * self.size)
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+
+class UserRecordCache:
+    """Bounded LRU of users whose rows are known to exist, with their username and rolled-over day.
+
+    A hit means the per-command upsert would change nothing, so it can be
+    skipped. Callers only remember rows once they are committed."""
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.users = OrderedDict()  # user_id -> (username or None if unknown, day epoch)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def fresh(self, user_id, username, epoch):
+        """True if the row exists, is rolled into `epoch` and (unless username is None) has that name."""
+        entry = self.users.get(user_id)
+        if entry is not None and entry[1] == epoch and (username is None or entry[0] == username):
+            self.users.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return True
+        self.stats["misses"] += 1
+        return False
+
+    def remember(self, user_id, username, epoch):
+        """Records a committed row; username None keeps whatever name was known."""
+        entry = self.users.get(user_id)
+        if username is None and entry is not None:
+            username = entry[0]
+        self.users[user_id] = (username, epoch)
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def forget(self, user_id):
+        self.users.pop(user_id, None)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 3) if lookups else 0.0
+        data["entries"] = len(self.users)
+        return data
+
+def normalize_username(name):
+    return (name or "").strip().lstrip("@").lower()
+
+class UsernameIndex:
+    """Case-insensitive username -> user_id map for /smack @user and /gift @user.
+
+    Loaded from pf_users at startup, refreshed periodically and updated from
+    every user seen in an update. Once loaded a miss is treated as final;
+    before that, names the database didn't know are remembered for a while
+    so repeated lookups of made-up names don't reach it again."""
+
+    def __init__(self, negative_ttl_seconds=300, max_negative=5000):
+        self.names = {}       # normalized name -> user_id
+        self.by_id = {}       # user_id -> stored username
+        self.loaded = False
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_negative = max_negative
+        self.negative = OrderedDict()  # normalized name -> monotonic time it was found missing
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0, "observed": 0, "renames": 0, "loads": 0}
+
+    def load(self, rows):
+        names, by_id = {}, {}
+        for user_id, username in rows:
+            key = normalize_username(username)
+            if key:
+                names[key] = user_id
+                by_id[user_id] = username
+        self.names, self.by_id = names, by_id
+        self.negative.clear()
+        self.loaded = True
+        self.stats["loads"] += 1
+
+    def observe(self, user_id, username):
+        key = normalize_username(username)
+        if not key or self.by_id.get(user_id) == username:
+            return
+        old = self.by_id.get(user_id)
+        if old is not None:
+            old_key = normalize_username(old)
+            if self.names.get(old_key) == user_id:
+                del self.names[old_key]
+            self.stats["renames"] += 1
+        self.names[key] = user_id
+        self.by_id[user_id] = username
+        self.negative.pop(key, None)
+        self.stats["observed"] += 1
+
+    def resolve(self, name):
+        """Returns (user_id, stored username) or None."""
+        user_id = self.names.get(normalize_username(name))
+        if user_id is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return user_id, self.by_id[user_id]
+
+    def needs_lookup(self, name, now):
+        """True when a miss can't be trusted yet and the name isn't cached as missing."""
+        if self.loaded:
+            return False
+        key = normalize_username(name)
+        missing_since = self.negative.get(key)
+        if missing_since is not None and now - missing_since < self.negative_ttl_seconds:
+            self.stats["negative_hits"] += 1
+            return False
+        return bool(key)
+
+    def mark_missing(self, name, now):
+        key = normalize_username(name)
+        self.negative[key] = now
+        self.negative.move_to_end(key)
+        while len(self.negative) > self.max_negative:
+            self.negative.popitem(last=False)
+
+    def snapshot(self):
+        data = dict(self.stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 3) if lookups else 0.0
+        data["loaded"] = self.loaded
+        data["names"] = len(self.names)
+        data["negative"] = len(self.negative)
+        return data
@@ -0,0 +1,93 @@
+import hmac
+import logging
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+STATS_HEADER = "X-Stats-Token"
+
+class WebServer:
+    """The bot's single HTTP server, running on the bot's own event loop.
+
+    Serves liveness (/), readiness (/ready) and /stats, and when a webhook
+    path is given also accepts Telegram updates there. /stats needs the stats
+    token in the X-Stats-Token header and is refused when no token is set. Updates are only
+    acknowledged once they are queued, so Telegram redelivers anything that
+    arrives while the bot is not ready."""
+
+    def __init__(self, host="0.0.0.0", port=10000, banner="OK", stats=None, ready=None,
+                 webhook_path=None, webhook_secret=None, on_update=None, stats_token=None):
+        self.host = host
+        self.port = port
+        self.banner = banner
+        self.stats_source = stats or dict  # () -> dict
+        self.ready = ready or (lambda: True)
+        self.webhook_path = webhook_path
+        self.webhook_secret = webhook_secret
+        self.on_update = on_update  # async (payload dict) -> None
+        self.stats_token = stats_token
+        self._runner = None
+        self.stats = {"webhook_updates": 0, "webhook_rejected": 0, "webhook_errors": 0}
+
+    def _build(self):
+        app = web.Application()
+        app.router.add_get("/", self._health)
+        app.router.add_get("/ready", self._readiness)
+        app.router.add_get("/stats", self._stats)
+        if self.webhook_path:
+            app.router.add_post(self.webhook_path, self._webhook)
+        return app
+
+    async def start(self):
+        if web is None:
+            raise RuntimeError("aiohttp is required for the web server")
+        self._runner = web.AppRunner(self._build(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🌐 Web server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _health(self, request):
+        return web.Response(text=self.banner)
+
+    async def _readiness(self, request):
+        if self.ready():
+            return web.json_response({"ready": True})
+        return web.json_response({"ready": False}, status=503)
+
+    async def _stats(self, request):
+        token = request.headers.get(STATS_HEADER, "")
+        if not self.stats_token or not hmac.compare_digest(token, self.stats_token):
+            return web.Response(status=403)
+        return web.json_response(self.stats_source())
+
+    async def _webhook(self, request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if self.webhook_secret and not hmac.compare_digest(token, self.webhook_secret):
+            self.stats["webhook_rejected"] += 1
+            return web.Response(status=403)
+        if not self.ready():
+            return web.Response(status=503)
+        try:
+            payload = await request.json()
+            await self.on_update(payload)
+        except Exception as e:
+            self.stats["webhook_errors"] += 1
+            logger.warning(f"Webhook update rejected: {e}")
+            return web.Response(status=400)
+        self.stats["webhook_updates"] += 1
+        return web.Response()
+
+    def snapshot(self):
+        data = dict(self.stats)
+        data["mode"] = "webhook" if self.webhook_path else "polling"
+        return data